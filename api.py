@@ -0,0 +1,319 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import gzip
+import json
+from datetime import datetime
+import dateutil.parser
+from flask import Blueprint, Response, current_app, request
+from sqlalchemy import func, select
+from models import db, Venue, Artist, Show
+from http_cache import conditional
+from profiler import query_budget
+from replicas import read_only
+import exporter
+import queries
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ----------------------------------------------------------------------------#
+# JSON API, version 1.
+#
+#   GET /api/v1/<venues|artists|shows>            pages in id order (?after=, ?limit=)
+#   GET /api/v1/<venues|artists|shows>?ids=1,2,3  batch get, one IN query
+#   GET /api/v1/<venues|artists|shows>/<id>
+#
+# ?fields=id,name selects only those columns. ?include=shows (venues,
+# artists) or ?include=venue,artist (shows) adds the related rows of the
+# whole response with one more IN query each, as genres are; included shows
+# stop at API_INCLUDE_SHOWS per row, the rest is paged from
+# /shows?venue_id= (or artist_id=). Bodies are
+# encoded with orjson when it is installed and gzipped for clients that
+# accept it once they pass API_GZIP_MIN_SIZE.
+#
+# Optional: pip install orjson
+# ----------------------------------------------------------------------------#
+
+blueprint = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# resource: (model, field -> column)
+RESOURCES = {
+    'venues': (Venue, {
+        'id': Venue.id, 'name': Venue.name, 'city': Venue.city, 'state': Venue.state,
+        'address': Venue.address, 'phone': Venue.phone, 'image_link': Venue.image_link,
+        'facebook_link': Venue.facebook_link, 'website': Venue.website,
+        'seeking_talent': Venue.seeking_talent, 'seeking_description': Venue.seeking_description,
+        'latitude': Venue.latitude, 'longitude': Venue.longitude,
+        'upcoming_shows_count': Venue.upcoming_count, 'past_shows_count': Venue.past_count,
+        'updated_at': Venue.updated_at,
+    }),
+    'artists': (Artist, {
+        'id': Artist.id, 'name': Artist.name, 'city': Artist.city, 'state': Artist.state,
+        'phone': Artist.phone, 'image_link': Artist.image_link, 'facebook_link': Artist.facebook_link,
+        'website': Artist.website, 'seeking_venue': Artist.seeking_venue,
+        'seeking_description': Artist.seeking_description,
+        'upcoming_shows_count': Artist.upcoming_count, 'past_shows_count': Artist.past_count,
+        'updated_at': Artist.updated_at,
+    }),
+    'shows': (Show, {
+        'id': Show.id, 'venue_id': Show.venue_id, 'artist_id': Show.artist_id,
+        'start_time': Show.start_time, 'end_time': Show.end_time, 'updated_at': Show.updated_at,
+    }),
+}
+# fields that are not columns of the resource's table
+EXTRA_FIELDS = {'venues': ('genres',), 'artists': ('genres',), 'shows': ()}
+INCLUDES = {'venues': ('shows',), 'artists': ('shows',), 'shows': ('venue', 'artist')}
+# the show of a venue/artist: its key, the other side and the other side's key
+SHOW_SIDES = {
+    'venues': (Show.venue_id, Artist, Show.artist_id, 'artist'),
+    'artists': (Show.artist_id, Venue, Show.venue_id, 'venue'),
+}
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, message):
+        super(ApiError, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+#  Encoding
+#  ----------------------------------------------------------------
+
+def default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=default, separators=(',', ':')).encode('utf-8')
+
+
+def respond(data, status=200):
+    body = dumps(data)
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= current_app.config.get('API_GZIP_MIN_SIZE', 1024) and request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(body, current_app.config.get('API_GZIP_LEVEL', 6)))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@blueprint.errorhandler(ApiError)
+def api_error(error):
+    return respond({'error': error.message}, error.status)
+
+
+#  Arguments
+#  ----------------------------------------------------------------
+
+def listed(name, allowed=None):
+    # a comma separated argument, checked against allowed
+    values = [value.strip() for value in request.args.get(name, '').split(',') if value.strip()]
+    if allowed is not None:
+        unknown = [value for value in values if value not in allowed]
+        if unknown:
+            raise ApiError(400, 'unknown %s: %s' % (name, ', '.join(unknown)))
+    return values
+
+
+def fields_of(kind):
+    _, columns = RESOURCES[kind]
+    allowed = tuple(columns) + EXTRA_FIELDS[kind]
+    return listed('fields', allowed) or list(allowed)
+
+
+def integer(name, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(400, '%s must be an integer' % name)
+
+
+def timestamp(name):
+    value = request.args.get(name)
+    try:
+        return dateutil.parser.parse(value) if value else None
+    except (ValueError, OverflowError):
+        raise ApiError(400, '%s must be a date' % name)
+
+
+#  Loading
+#  ----------------------------------------------------------------
+
+def select_fields(kind, fields):
+    # the statement for fields; id is always selected, for the lookups
+    model, columns = RESOURCES[kind]
+    names = ['id'] + [field for field in fields if field in columns and field != 'id']
+    return select(*[columns[name].label(name) for name in names]), model
+
+
+def shaped(kind, rows, fields):
+    # row dicts with fields, in order, plus the batched extras
+    items = [dict(row._mapping) for row in rows]
+    ids = [item['id'] for item in items]
+    if 'genres' in fields and ids:
+        genres = exporter.genres_of(kind, ids)
+        for item in items:
+            item['genres'] = genres.get(item['id'], [])
+    for include in listed('include', INCLUDES[kind]):
+        attach(kind, include, items)
+    for item in items:
+        if 'id' not in fields:
+            item.pop('id')
+    return items
+
+
+def attach(kind, include, items):
+    if not items:
+        return
+    if kind == 'shows':
+        # ?include=venue,artist: one IN query per side
+        key = include + '_id'
+        if key not in items[0]:
+            raise ApiError(400, 'include=%s needs the %s field' % (include, key))
+        ids = {item[key] for item in items}
+        model = Venue if include == 'venue' else Artist
+        related = {
+            row.id: dict(row._mapping)
+            for row in db.session.execute(
+                select(model.id, model.name, model.image_link).where(model.id.in_(ids))
+            )
+        }
+        for item in items:
+            item[include] = related.get(item[key])
+        return
+    # ?include=shows: the first API_INCLUDE_SHOWS shows of every item, in
+    # one query numbering each item's shows
+    key, other, other_key, prefix = SHOW_SIDES[kind]
+    cap = current_app.config.get('API_INCLUDE_SHOWS', 20)
+    number = func.row_number().over(partition_by=key, order_by=(Show.start_time, Show.id)).label('number')
+    numbered = select(key.label('owner_id'), Show.id, Show.start_time, Show.end_time,
+                      other.id.label(prefix + '_id'), other.name.label(prefix + '_name'),
+                      other.image_link.label(prefix + '_image_link'), number) \
+        .join(other, other.id == other_key) \
+        .where(key.in_([item['id'] for item in items])).subquery()
+    shows, more = {}, set()
+    rows = db.session.execute(
+        select(numbered).where(numbered.c.number <= cap + 1)
+        .order_by(numbered.c.owner_id, numbered.c.number)
+    )
+    for row in rows:
+        show = dict(row._mapping)
+        owner = show.pop('owner_id')
+        if show.pop('number') > cap:
+            more.add(owner)
+            continue
+        shows.setdefault(owner, []).append(show)
+    for item in items:
+        item['shows'] = shows.get(item['id'], [])
+        item['more_shows'] = item['id'] in more
+
+
+def listing(kind):
+    fields = fields_of(kind)
+    statement, model = select_fields(kind, fields)
+    ids = listed('ids')
+    if ids:
+        # batch get: one IN query, returned in the order asked
+        try:
+            ids = [int(id) for id in ids]
+        except ValueError:
+            raise ApiError(400, 'ids must be integers')
+        if len(ids) > current_app.config.get('API_MAX_IDS', 100):
+            raise ApiError(400, 'at most %d ids' % current_app.config.get('API_MAX_IDS', 100))
+        rows = {row.id: row for row in db.session.execute(statement.where(model.id.in_(ids)))}
+        found = [rows[id] for id in dict.fromkeys(ids) if id in rows]
+        return respond({'data': shaped(kind, found, fields),
+                        'missing': [id for id in dict.fromkeys(ids) if id not in rows]})
+
+    # a page in id order, seeking past ?after=
+    limit = min(max(1, integer('limit', current_app.config.get('API_PAGE_SIZE', 100))),
+                current_app.config.get('API_MAX_PAGE_SIZE', 500))
+    after = integer('after')
+    if after is not None:
+        statement = statement.where(model.id > after)
+    if kind == 'shows':
+        start, end = timestamp('from'), timestamp('to')
+        for name in ('venue_id', 'artist_id'):
+            id = integer(name)
+            if id is not None:
+                statement = statement.where(getattr(Show, name) == id)
+        if start:
+            statement = statement.where(Show.start_time >= start)
+        if end:
+            statement = statement.where(Show.start_time < end)
+    rows = db.session.execute(statement.order_by(model.id).limit(limit + 1)).all()
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return respond({'data': shaped(kind, rows[:limit], fields), 'next_after': next_after})
+
+
+def detail(kind, id):
+    fields = fields_of(kind)
+    statement, model = select_fields(kind, fields)
+    row = db.session.execute(statement.where(model.id == id)).first()
+    if row is None:
+        raise ApiError(404, 'no %s %d' % (kind[:-1], id))
+    return respond({'data': shaped(kind, [row], fields)[0]})
+
+
+#  Routes
+#  ----------------------------------------------------------------
+
+@blueprint.route('/venues')
+@query_budget(3)
+@read_only
+def venues():
+    return listing('venues')
+
+
+@blueprint.route('/venues/<int:venue_id>')
+@query_budget(4)
+@read_only
+@conditional('entity', 'venue', queries.venue_validator, weak=True)
+def venue(venue_id):
+    return detail('venues', venue_id)
+
+
+@blueprint.route('/artists')
+@query_budget(3)
+@read_only
+def artists():
+    return listing('artists')
+
+
+@blueprint.route('/artists/<int:artist_id>')
+@query_budget(4)
+@read_only
+@conditional('entity', 'artist', queries.artist_validator, weak=True)
+def artist(artist_id):
+    return detail('artists', artist_id)
+
+
+@blueprint.route('/shows')
+@query_budget(3)
+@read_only
+def shows():
+    return listing('shows')
+
+
+@blueprint.route('/shows/<int:show_id>')
+@query_budget(3)
+@read_only
+def show(show_id):
+    return detail('shows', show_id)
+
+
+def init_app(app):
+    app.register_blueprint(blueprint)
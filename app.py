@@ -2,16 +2,42 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
+import hmac
 import logging
+import click
 from logging import Formatter, FileHandler
-from datetime import datetime
-import babel
+from datetime import datetime, timedelta
 import dateutil.parser
-from flask import Flask, render_template, request, flash, redirect, url_for
+from functools import wraps
+from flask import Flask, Response, render_template, request, flash, redirect, url_for, abort, jsonify, \
+    stream_with_context
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from forms import *
+from models import db, Venue, Artist, Show, Genre
+import config
+import queries
+import search
+import counters
+import cache
+import pooling
+import profiler
+import importer
+import exporter
+import replicas
+import templating
+import assets
+import http_cache
+import api
+import booking
+import geo
+from formatting import format_datetime
+from profiler import query_budget
+from replicas import read_only
+from http_cache import conditional
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -20,77 +46,29 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config.from_object(config.environment())
+if app.config.get('PROXY_FIX_X_FOR'):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+pooling.init_app(app)
+db.init_app(app)
+replicas.init_app(app)
 
 migrate = Migrate(app, db)
+search.init_app(app)
+cache.init_app(app)
+profiler.init_app(app)
+assets.init_app(app)
+http_cache.init_app(app)
+templating.init_app(app)
+api.init_app(app)
+geo.init_app(app)
 
 # TODO: connect to a local postgresql database --> DONE
 
-# ----------------------------------------------------------------------------#
-# Models.
-# ----------------------------------------------------------------------------#
-class Venue(db.Model):
-    __tablename__ = 'Venue'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False, unique=True)
-    city = db.Column(db.String(120), nullable=False)
-    state = db.Column(db.String(120), nullable=False)
-    address = db.Column(db.String(120), nullable=False)
-    phone = db.Column(db.String(120), nullable=False)
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.String(), nullable=False)
-    website = db.Column(db.String())
-    seeking_talent = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(), default='')
-
-    shows = db.relationship('Show', backref="venue", lazy=True)
-
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate -->
-
-
-class Artist(db.Model):
-    __tablename__ = 'Artist'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, unique=True)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120), default="")
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-    website = db.Column(db.String())
-    seeking_venue = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(), default="")
-
-    shows = db.relationship('Show', backref="artist", lazy=True)
-
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate --> ???
-
-
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
-class Show(db.Model):
-    __tablename__ = 'Show'
-    id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
-
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
-
-
 app.jinja_env.filters['datetime'] = format_datetime
 
 
@@ -107,115 +85,109 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@query_budget(2)
+@read_only
+@conditional('listing', 'venues', queries.venues_validator)
 def venues():
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.  --> done
-    places = Venue.query.with_entities(Venue.city, Venue.state).distinct().all()
-    data = []
-    for place in places:
-        category = {
-                "city": place.city,
-                "state": place.state,
-                "venues": []
-            }
-
-        venues = Venue.query.filter_by(city=place.city).filter_by(state=place.state).all()
-        for venue in venues:
-            category['venues'].append(
-                {
-                    'id': venue.id,
-                    'name': venue.name,
-                    "num_upcoming_shows": Show.query.filter
-                    (Show.start_time > datetime.now()).filter(Show.venue_id == venue.id).count()
-
-                }
-            )
-
-        data.append(category)
+    genre = request.args.get('genre', '')
+    data = cache.memoize('venues', None, (genre,), lambda: queries.venue_areas(genre))
 
-    return render_template('pages/venues.html', areas=data);
+    return render_template('pages/venues.html', areas=data, genre=genre);
 
 
 @app.route('/venues/search', methods=['POST'])
+@query_budget(2)
+@read_only
 def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive. --> done
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
     search_word = request.form.get('search_term', '')
-    data = []
-    venues = Venue.query.filter(Venue.name.ilike('%' + search_word + '%')).all()
-    for venue in venues:
-        data.append(
-            {
-                'id': venue.id,
-                'name': venue.name,
-                "num_upcoming_shows": Show.query.filter
-                    (Show.start_time > datetime.now()).filter(Show.venue_id == venue.id).count()
-            }
-        )
-
-    response = {
-        "count": Venue.query.filter(Venue.name.ilike('%' + search_word + '%')).count(),
-        "data": data
-    }
-    return render_template('pages/search_venues.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    genre = request.values.get('genre', '')
+    response = search.search(Venue, search_word, page=request.form.get('page', 1, type=int), genre=genre)
+    return render_template('pages/search_venues.html', results=response, search_term=search_word,
+                           genre=genre, page=request.form.get('page', 1, type=int))
+
+
+@app.route('/venues/near')
+@query_budget(2)
+@read_only
+def venues_near():
+    # venues within ?radius= miles (NEARBY_DEFAULT_RADIUS by default) of
+    # ?lat= and ?lng=, nearest first, ?limit= at most
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+    radius = request.args.get('radius', app.config.get('NEARBY_DEFAULT_RADIUS', 25), type=float)
+    limit = request.args.get('limit', 20, type=int)
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        abort(400)
+    if not 0 < radius <= app.config.get('NEARBY_MAX_RADIUS', 500) or not 0 < limit <= 100:
+        abort(400)
+    results = geo.near(latitude, longitude, radius, limit)
+    return jsonify({'count': len(results['data']), 'radius': radius,
+                    'index_ms': round(results['index_ms'], 3), 'data': results['data']})
 
 
 @app.route('/venues/<int:venue_id>')
+@query_budget(3)
+@read_only
+@conditional('entity', 'venue', queries.venue_validator)
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id --> done
 
-    venue = Venue.query.get(venue_id)
-    if not venue:
+    past_page = request.args.get('past_page', 1, type=int)
+    upcoming_page = request.args.get('upcoming_page', 1, type=int)
+    data = cache.memoize('venue', venue_id, (past_page, upcoming_page), lambda: queries.venue_detail(
+        venue_id, past_page=past_page, upcoming_page=upcoming_page
+    ))
+    if not data:
         return render_template('pages/home.html')
-    data = {
-        "id": venue.id,
-        "name": venue.name,
-        "genres": venue.genres.split(',') if venue.genres else [],
-        "address": venue.address,
-        "city": venue.city,
-        "state": venue.state,
-        "phone": venue.phone,
-        "website": venue.website,
-        "facebook_link": venue.facebook_link,
-        "seeking_talent": venue.seeking_talent,
-        "seeking_description": venue.seeking_description,
-        "image_link": venue.image_link,
-        "past_shows": [],
-        "upcoming_shows": [],
-        "past_shows_count": Show.query.filter
-                    (Show.start_time < datetime.now()).filter(Show.venue_id == venue.id).count(),
-        "upcoming_shows_count": Show.query.filter
-                    (Show.start_time > datetime.now()).filter(Show.venue_id == venue.id).count()
-    }
 
-    past = Show.query.filter(Show.start_time < datetime.now()).filter(Show.venue_id == venue.id).all()
-    for show in past:
-        artist = Artist.query.get(show.artist_id)
-        data['past_shows'].append(
-            {
-                'artist_id': artist.id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": show.start_time
-            }
-        )
+    return render_template('pages/show_venue.html', venue=data)
 
-    future = Show.query.filter(Show.start_time > datetime.now()).filter(Show.venue_id == venue.id).all()
-    for show in future:
-        artist = Artist.query.get(show.artist_id)
-        data['upcoming_shows'].append(
-            {
-                'artist_id': artist.id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": show.start_time
-            }
-        )
 
-    return render_template('pages/show_venue.html', venue=data)
+@app.route('/venues/<int:venue_id>/free-slots')
+@query_budget(2)
+@read_only
+def venue_free_slots(venue_id):
+    # the gaps between the venue's shows in ?month= (YYYY-MM, this month by
+    # default) long enough for a show of ?minutes= (SHOW_LENGTH by default)
+    try:
+        start, end = booking.month_of(request.args.get('month'))
+        minutes = request.args.get('minutes', type=int)
+        length = timedelta(minutes=minutes) if minutes is not None else booking.SHOW_LENGTH
+    except ValueError:
+        abort(400)
+    if length <= timedelta(0) or length > booking.SHOW_MAX_LENGTH:
+        abort(400)
+    if db.session.scalar(select(Venue.id).where(Venue.id == venue_id)) is None:
+        abort(404)
+    slots = cache.memoize('venue', venue_id, ('free_slots', start.isoformat(), length.total_seconds()), lambda: [
+        {'start_time': slot['start_time'].isoformat(), 'end_time': slot['end_time'].isoformat()}
+        for slot in booking.free_slots(venue_id, start, end, length)
+    ])
+    return jsonify({'venue_id': venue_id, 'month': start.strftime('%Y-%m'),
+                    'minutes': length // timedelta(minutes=1), 'free_slots': slots})
+
+
+@app.route('/venues/<int:venue_id>/calendar')
+@query_budget(1)
+@read_only
+def venue_calendar(venue_id):
+    # the venue's shows by day of ?month= (YYYY-MM, this month by default)
+    try:
+        start, end = booking.month_of(request.args.get('month'))
+    except ValueError:
+        abort(400)
+    data = cache.memoize('venue', venue_id, ('calendar', start.strftime('%Y-%m')), lambda: queries.venue_calendar(
+        venue_id, start, end
+    ))
+    if not data:
+        abort(404)
+    return render_template('pages/venue_calendar.html', month=data)
 
 
 #  Create Venue
@@ -238,11 +210,12 @@ def create_venue_submission():
             state=request.form['state'],
             address= request.form['address'],
             phone=request.form['phone'],
-            genres=request.form['genres'],
+            genres=Genre.named(request.form.getlist('genres')),
             facebook_link=request.form['facebook_link']
         )
         data = db.session.add(venue)
         db.session.commit()
+        cache.invalidate(('venues', None))
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
 # TODO: on unsuccessful db insert, flash an error instead.
@@ -260,8 +233,13 @@ def delete_venue(venue_id):
     # TODO: Complete this endpoint for taking a venue_id, and using --> done
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
     try:
-        Venue.query.filter(Venue.id == venue_id).delete()
+        # through the session, so the search and nearby indexes (and the
+        # venue's genre links) see the delete; a bulk Query.delete() skips them
+        venue = db.session.get(Venue, venue_id)
+        if venue is not None:
+            db.session.delete(venue)
         db.session.commit()
+        cache.invalidate_venue(venue_id)
     except:
         db.session.rollback()
     finally:
@@ -275,96 +253,72 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@query_budget(3)
+@read_only
+@conditional('listing', 'artists', queries.artists_validator)
 def artists():
     # TODO: replace with real data returned from querying the database --> done
-    artists = Artist.query.all()
-    data = []
-    for artist in artists:
-        data.append(
-            {
-
-                "id": artist.id,
-                "name": artist.name
-            }
-        )
-    return render_template('pages/artists.html', artists=data)
+    genre, letter, after, data = artist_page()
+    return render_template('pages/artists.html', artists=data['artists'], letters=data['letters'],
+                           next_cursor=data['next_cursor'], genre=genre, letter=letter, after=after)
+
+
+@app.route('/artists.json')
+@query_budget(3)
+@read_only
+@conditional('listing', 'artists', queries.artists_validator)
+def artists_json():
+    # the next pages of /artists for infinite scrolling, by the same cursor
+    genre, letter, after, data = artist_page()
+    next_url = None
+    if data['next_cursor']:
+        next_url = url_for('artists_json', after=data['next_cursor'], genre=genre or None)
+    return jsonify({'artists': data['artists'], 'next_cursor': data['next_cursor'], 'next_url': next_url})
+
+
+def artist_page():
+    # ?genre=, ?letter= (jump to the first artist filed under it) and
+    # ?after= (the cursor of the previous page)
+    genre = request.args.get('genre', '')
+    letter = request.args.get('letter', '').upper()[:1]
+    after = request.args.get('after')
+    try:
+        data = cache.memoize('artists', None, (genre, letter, after), lambda: queries.artist_page(
+            genre, letter, after
+        ))
+    except ValueError:
+        abort(400)
+    return genre, letter, after, data
 
 
 @app.route('/artists/search', methods=['POST'])
+@query_budget(2)
+@read_only
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive. --> done
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     search_word = request.form.get('search_term', '')
-    data = []
-    artists = Artist.query.filter(Artist.name.ilike("%" + search_word + "%")).all()
-    for artist in artists:
-        data.append(
-            {
-                "id": artist.id,
-                "name": artist.name,
-                "num_upcoming_shows": Show.query.filter(
-                    Show.start_time > datetime.now()).filter(Show.venue_id == artist.id).count()
-            }
-        )
-
-    response = {
-        "count": Artist.query.filter(Artist.name.ilike("%" + search_word + "%")).count(),
-        "data": data
-    }
-    return render_template('pages/search_artists.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    genre = request.values.get('genre', '')
+    response = search.search(Artist, search_word, page=request.form.get('page', 1, type=int), genre=genre)
+    return render_template('pages/search_artists.html', results=response, search_term=search_word,
+                           genre=genre, page=request.form.get('page', 1, type=int))
 
 
 @app.route('/artists/<int:artist_id>')
+@query_budget(3)
+@read_only
+@conditional('entity', 'artist', queries.artist_validator)
 def show_artist(artist_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id --> done
-    artist = Artist.query.get(artist_id)
-    data = {
-        "id": artist.id,
-        "name": artist.name,
-        "genres": artist.genres.split(',') if artist.genres else "",
-        "city": artist.city,
-        "state": artist.state,
-        "phone": artist.phone,
-        "website": artist.website,
-        "facebook_link": artist.facebook_link,
-        "seeking_venue": artist.seeking_venue,
-        "seeking_description": artist.seeking_description,
-        "image_link": artist.image_link,
-        "past_shows": [],
-        "upcoming_shows": [],
-        "past_shows_count": Show.query.filter
-        (Show.start_time < datetime.now()).filter(Show.artist_id == artist.id).count(),
-        "upcoming_shows_count": Show.query.filter
-        (Show.start_time > datetime.now()).filter(Show.artist_id == artist.id).count()
-    }
-
-    past = Show.query.filter(Show.start_time < datetime.now()).filter(Show.artist_id == artist.id).all()
-
-    for show in past:
-        venue = Venue.query.get(show.venue_id)
-        data['past_shows'].append(
-            {
-                'venue_id': venue.id,
-                "venue_name": venue.name,
-                "venue_image_link": venue.image_link,
-                "start_time": show.start_time
-            }
-        )
-
-    future = Show.query.filter(Show.start_time > datetime.now()).filter(Show.artist_id == artist.id).all()
-    for show in future:
-        venue = Venue.query.get(show.venue_id)
-        data['upcoming_shows'].append(
-            {
-                'venue_id': venue.id,
-                "venue_name": venue.name,
-                "venue_image_link": venue.image_link,
-                "start_time": show.start_time
-            }
-        )
+    past_page = request.args.get('past_page', 1, type=int)
+    upcoming_page = request.args.get('upcoming_page', 1, type=int)
+    data = cache.memoize('artist', artist_id, (past_page, upcoming_page), lambda: queries.artist_detail(
+        artist_id, past_page=past_page, upcoming_page=upcoming_page
+    ))
+    if not data:
+        return render_template('pages/home.html')
 
     return render_template('pages/show_artist.html', artist=data)
 
@@ -378,7 +332,7 @@ def edit_artist(artist_id):
     artist = {
         "id": data.id,
         "name": data.name,
-        "genres": data.genres.split(','),
+        "genres": queries.genre_names(data),
         "city": data.city,
         "state": data.state,
         "phone": data.phone,
@@ -398,13 +352,18 @@ def edit_artist_submission(artist_id):
     # artist record with ID <artist_id> using the new attributes
     try:
         artist = Artist.query.get(artist_id)
-        artist.name = request.form['name'],
-        artist.city = request.form['city'],
-        artist.state = request.form['state'],
-        artist.phone = request.form['phone'],
-        artist.genres = request.form['genres'],
+        old_letter = artist.letter
+        artist.name = request.form['name']
+        counters.artist_renamed(artist, old_letter)
+        artist.city = request.form['city']
+        artist.state = request.form['state']
+        artist.phone = request.form['phone']
+        artist.genres = Genre.named(request.form.getlist('genres'))
         artist.facebook_link = request.form['facebook_link']
+        # genre changes alone do not update the row
+        artist.updated_at = datetime.now()
         db.session.commit()
+        cache.invalidate_artist(artist_id)
     except:
         db.session.rollback()
     finally:
@@ -420,7 +379,7 @@ def edit_venue(venue_id):
     venue = {
         "id": data.id,
         "name": data.name,
-        "genres": data.genres,
+        "genres": queries.genre_names(data),
         "address": data.address,
         "city": data.city,
         "state": data.state,
@@ -441,14 +400,17 @@ def edit_venue_submission(venue_id):
     # venue record with ID <venue_id> using the new attributes
     try:
         venue = Venue.query.get(venue_id)
-        venue.name = request.form['name'],
-        venue.city = request.form['city'],
-        venue.state = request.form['state'],
-        venue.address = request.form['address'],
-        venue.phone = request.form['phone'],
-        venue.genres = request.form['genres'],
+        venue.name = request.form['name']
+        venue.city = request.form['city']
+        venue.state = request.form['state']
+        venue.address = request.form['address']
+        venue.phone = request.form['phone']
+        venue.genres = Genre.named(request.form.getlist('genres'))
         venue.facebook_link = request.form['facebook_link']
+        # genre changes alone do not update the row
+        venue.updated_at = datetime.now()
         db.session.commit()
+        cache.invalidate_venue(venue_id)
     except:
         db.session.rollback()
     finally:
@@ -478,11 +440,13 @@ def create_artist_submission():
             city=request.form['city'],
             state=request.form['state'],
             phone=request.form['phone'],
-            genres=request.form['genres'],
+            genres=Genre.named(request.form.getlist('genres')),
             facebook_link=request.form['facebook_link']
         )
         db.session.add(artist)
+        counters.artist_added(artist)
         db.session.commit()
+        cache.invalidate(('artists', None))
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
         # TODO: on unsuccessful db insert, flash an error instead.
@@ -499,24 +463,45 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@query_budget(2)
+@read_only
+@conditional('listing', 'shows', queries.shows_validator)
 def shows():
     # displays list of shows at /shows
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
-    shows = Show.query.all()
-    data = []
-    for show in shows:
-        item = {
-            "venue_id": show.venue_id,
-            "venue_name": Venue.query.get(show.venue_id).name,
-            "artist_id": show.artist_id,
-            "artist_name": Artist.query.get(show.artist_id).name,
-            "artist_image_link": Artist.query.get(show.artist_id).image_link,
-            "start_time": show.start_time
-        }
-        data.append(item)
-
-    return render_template('pages/shows.html', shows=data)
+    after = request.args.get('after')
+    start = request.args.get('from')
+    end = request.args.get('to')
+    try:
+        data, next_cursor = cache.memoize('shows', None, (after, start, end), lambda: queries.shows_page(
+            after=after,
+            start=dateutil.parser.parse(start) if start else None,
+            end=dateutil.parser.parse(end) if end else None
+        ))
+    except (ValueError, OverflowError):
+        abort(400)
+
+    return render_template('pages/shows.html', shows=data, next_cursor=next_cursor,
+                           after=after, start=start, end=end)
+
+
+@app.route('/shows/calendar')
+@query_budget(1)
+@read_only
+def shows_calendar():
+    # shows per day of ?month= (YYYY-MM, this month by default); each day
+    # links to its /shows?from=&to= range
+    try:
+        start, end = booking.month_of(request.args.get('month'))
+    except ValueError:
+        abort(400)
+    # a per-process cache only drops the month in the worker adding the show,
+    # so the long TTL waits for a shared backend
+    month = cache.memoize('month', start.strftime('%Y-%m'), ('counts',), lambda: queries.calendar_counts(
+        start, end
+    ), ttl=app.config.get('CALENDAR_CACHE_TTL') if cache.shared() else None)
+    return render_template('pages/calendar.html', month=month)
 
 
 @app.route('/shows/create')
@@ -531,22 +516,32 @@ def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead
     try:
-        if Artist.query.filter(Artist.id == request.form['artist_id']).count() == 0:
-            raise ValueError
-        if Venue.query.filter(Venue.id == request.form['venue_id']).count() == 0:
+        venue_id, artist_id = int(request.form['venue_id']), int(request.form['artist_id'])
+        if not booking.parties_exist(venue_id, artist_id):
             raise ValueError
+        start_time, end_time = booking.span(dateutil.parser.parse(request.form['start_time']),
+                                            dateutil.parser.parse(request.form['end_time'])
+                                            if request.form.get('end_time') else None)
+        booking.check(venue_id, artist_id, start_time, end_time)
 
-        show = Show(
-            artist_id=request.form['artist_id'],
-            venue_id=request.form['venue_id'],
-            start_time=request.form['start_time'],
-        )
+        show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=end_time)
         db.session.add(show)
+        counters.show_added(show)
         db.session.commit()
+        cache.invalidate_show(show.venue_id, show.artist_id, show.start_time)
         # on successful db insert, flash success
         flash('Show was successfully listed!')
         # TODO: on unsuccessful db insert, flash an error instead.
 
+    except (booking.BookingConflict, IntegrityError) as e:
+        db.session.rollback()
+        if isinstance(e, IntegrityError) and not booking.conflict(e):
+            flash('An error occurred. Show could not be listed.')
+        else:
+            flash('The venue or the artist is already booked at that time. Show could not be listed.')
+    except booking.BookingError as e:
+        db.session.rollback()
+        flash('%s. Show could not be listed.' % str(e).capitalize())
     except:
         db.session.rollback()
         flash('An error occurred. Show could not be listed.')
@@ -558,6 +553,163 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, ndjson):format>')
+@read_only
+def export(kind, format):
+    # streams the whole table, or the rows changed since ?updated_since=
+    updated_since = request.args.get('updated_since')
+    try:
+        updated_since = dateutil.parser.parse(updated_since) if updated_since else None
+    except (ValueError, OverflowError):
+        abort(400)
+    chunks = exporter.generate(kind, format, updated_since, app.config.get('EXPORT_YIELD_PER', 1000))
+    return Response(stream_with_context(chunks), mimetype=exporter.CONTENT_TYPES[format], headers={
+        'Content-Disposition': 'attachment; filename=%s.%s' % (kind, format)
+    })
+
+
+#  Internal
+#  ----------------------------------------------------------------
+
+def has_internal_token():
+    token = app.config.get('INTERNAL_TOKEN')
+    return bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), ('Bearer ' + token).encode())
+
+
+def internal(f):
+    # internal endpoints only answer INTERNAL_TOKEN holders and requests from
+    # INTERNAL_ALLOWED_HOSTS
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not has_internal_token() and request.remote_addr not in app.config.get('INTERNAL_ALLOWED_HOSTS', ()):
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated
+
+
+def internal_write(f):
+    # internal endpoints writing to the database only answer INTERNAL_TOKEN
+    # holders, whatever their address
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not has_internal_token():
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated
+
+
+@app.route('/_internal/cache')
+@internal
+def cache_stats():
+    return jsonify(cache.backend().info())
+
+
+@app.route('/_internal/pool')
+@internal
+def pool_stats():
+    return jsonify(pooling.stats(db.engine))
+
+
+@app.route('/_internal/replicas')
+@internal
+def replica_stats():
+    return jsonify([
+        dict(replica, pool=pooling.stats(db.engines[replica['bind']])) for replica in replicas.info()
+    ])
+
+
+@app.route('/_internal/import/<any(venues, artists, shows):kind>', methods=['POST'])
+@internal_write
+def import_upload(kind):
+    # multipart upload of a .csv or .ndjson file in the "file" field
+    upload = request.files.get('file')
+    if upload is None:
+        abort(400)
+    report = importer.run(kind, upload.stream, importer.format_of(upload.filename or ''),
+                          batch_size=app.config.get('IMPORT_BATCH_SIZE', 5000))
+    return jsonify(report.as_dict())
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@app.cli.command('roll-over-shows')
+@click.option('--all', 'recount_all', is_flag=True, help='Recount every venue and artist, and the artists per letter.')
+def roll_over_shows(recount_all):
+    # run periodically (e.g. from cron every few minutes) to move shows that
+    # have started from the upcoming to the past counters
+    rows = counters.roll_over(stale_only=not recount_all)
+    cache.invalidate(('venues', None))
+    if recount_all:
+        counters.recount_letters()
+        db.session.commit()
+        cache.invalidate(('artists', None))
+    click.echo('Rolled over %(Venue)d venues and %(Artist)d artists.' % rows)
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('source', type=click.File('rb'))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']),
+              help='Defaults to csv for *.csv files and ndjson otherwise.')
+@click.option('--batch-size', type=int, help='Rows per batch, IMPORT_BATCH_SIZE by default.')
+def import_rows(kind, source, format, batch_size):
+    # flask import shows shows.ndjson; SOURCE may be - for stdin
+    def progress(batch):
+        click.echo('batch %(batch)d: %(imported)d imported, %(rejected)d rejected, '
+                   '%(rows_per_second).0f rows/s' % batch)
+
+    report = importer.run(kind, source, format or importer.format_of(source.name),
+                          batch_size=batch_size or app.config.get('IMPORT_BATCH_SIZE', 5000),
+                          progress=progress)
+    for line, errors in report.rejected:
+        click.echo('line %s rejected: %s' % (line, '; '.join(
+            '%s: %s' % (field, ', '.join(messages)) for field, messages in errors.items())), err=True)
+    summary = report.as_dict()
+    click.echo('Imported %d %s in %.1fs (%.0f rows/s), %d rejected.' % (
+        summary['imported'], kind, summary['seconds'], summary['rows_per_second'], len(report.rejected)))
+
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']), default='ndjson')
+@click.option('--updated-since', type=click.DateTime(), help='Only rows changed since then.')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='Defaults to stdout.')
+def export_rows(kind, format, updated_since, output):
+    # flask export shows --format csv -o shows.csv
+    for chunk in exporter.generate(kind, format, updated_since, app.config.get('EXPORT_YIELD_PER', 1000)):
+        output.write(chunk)
+
+
+@app.cli.command('geocode-venues')
+@click.option('--all', 'geocode_all', is_flag=True, help='Geocode every venue, not only those without coordinates.')
+def geocode_venues(geocode_all):
+    # run once after migrating, and after changing GEOCODER or the gazetteer
+    looked_up, located = geo.geocode_all(missing_only=not geocode_all)
+    cache.invalidate(('venues', None))
+    click.echo('Located %d of %d venues.' % (located, looked_up))
+
+
+@app.cli.command('build-assets')
+def build_assets():
+    # run at build time, before `flask warmup`; the pages link the new files
+    # once the app restarts
+    manifest = assets.build(app.static_folder)
+    click.echo('Built %d assets into %s.' % (len(manifest), app.static_folder + '/' + assets.DIST))
+
+
+@app.cli.command('warmup')
+@click.option('--render/--no-render', default=True, help='Also render every page once against fixtures.')
+def warmup(render):
+    # run at build time to fill TEMPLATE_CACHE_DIR before the workers start
+    stats = templating.warm(app, render)
+    click.echo('Compiled %(compiled)d templates, rendered %(rendered)d pages in %(seconds).2fs.' % stats)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -582,9 +734,9 @@ if not app.debug:
 # Launch.
 # ----------------------------------------------------------------------------#
 
-# Default port:
+# Development server; deploy with gunicorn -c gunicorn.conf.py wsgi:app
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=app.config['DEBUG'])
 
 # Or specify port manually:
 '''
@@ -0,0 +1,364 @@
+# ----------------------------------------------------------------------------#
+# Async serving mode.
+#
+#   uvicorn asgi:application --workers 4
+#
+# Serves the read pages (venue/artist listings and detail pages, /shows)
+# natively on an ASGI server with SQLAlchemy's asyncio extension (asyncpg for
+# PostgreSQL, aiosqlite for SQLite), rendering the same templates in a Flask
+# request context. A detail page gathers its independent queries (the
+# venue/artist with its show counts, its genres, the past page and the
+# upcoming page) on separate connections instead of running them one after
+# the other (so their query budget covers the validator, those four and the
+# refetch of a page past the end). The app's before_request and
+# after_request hooks run around the async views as around its own; the
+# before_request ones (the sync validator query, Redis) on a worker thread,
+# releasing their session before the view runs. Every other request is handed
+# to the WSGI app through asgiref.
+#
+# Needs: pip install uvicorn asgiref greenlet asyncpg (or aiosqlite)
+# ----------------------------------------------------------------------------#
+
+import asyncio
+from datetime import datetime
+import dateutil.parser
+from asgiref.wsgi import WsgiToAsgi
+from flask import g, render_template, request, abort
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException
+from app import app
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres
+import cache
+import profiler
+import queries
+import templating
+from profiler import query_budget
+
+DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+wsgi = WsgiToAsgi(app)
+engines = {}
+
+
+def async_uri(uri):
+    url = make_url(uri)
+    return url.set(drivername=DRIVERS.get(url.get_backend_name(), url.drivername)) \
+        .render_as_string(hide_password=False)
+
+
+def engine():
+    # one engine per event loop and bind, pooled like the sync ones: the
+    # replica before_request picked for the request (see replicas.py), or the
+    # primary
+    replica = g.get('db_replica')
+    key = (asyncio.get_running_loop(), replica.key if replica else None)
+    if key not in engines:
+        config = app.config
+        if replica is not None:
+            uri = async_uri(replica.engine.url.render_as_string(hide_password=False))
+        else:
+            uri = config.get('ASYNC_DATABASE_URI') or async_uri(config['SQLALCHEMY_DATABASE_URI'])
+        engines[key] = create_async_engine(
+            uri,
+            pool_size=config.get('DB_POOL_SIZE', 5),
+            max_overflow=config.get('DB_MAX_OVERFLOW', 10),
+            pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+            pool_recycle=config.get('DB_POOL_RECYCLE', -1),
+            pool_pre_ping=config.get('DB_POOL_PRE_PING', True)
+        )
+        if config.get('SQL_PROFILER'):
+            event.listen(engines[key].sync_engine, 'before_cursor_execute', profiler.before_cursor_execute)
+            event.listen(engines[key].sync_engine, 'after_cursor_execute', profiler.after_cursor_execute)
+        if replica is not None:
+            def handle_error(context, replica=replica):
+                if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+                    app.logger.warning('ejecting %s: %s', replica.key, context.original_exception)
+                    replica.eject()
+            event.listen(engines[key].sync_engine, 'handle_error', handle_error)
+    return engines[key]
+
+
+async def fetch(statement):
+    # on a connection of its own, so fetches can be gathered
+    async with engine().connect() as connection:
+        return (await connection.execute(statement)).all()
+
+
+async def off_loop(f, *args):
+    # calls to a shared (Redis) cache backend run on a worker thread; the
+    # in-process backends answer right away
+    if cache.shared():
+        return await asyncio.to_thread(f, *args)
+    return f(*args)
+
+
+async def memoize(kind, id, parts, loader):
+    # cache.memoize for coroutine loaders; shares the sync mode's keys
+    def lookup():
+        key = cache.make_key(kind, id, ('data',) + tuple(parts))
+        return key, cache.backend().get(key)
+
+    key, value = await off_loop(lookup)
+    if value is cache.MISSING:
+        value = await loader()
+        if value is not None:
+            await off_loop(cache.backend().set, key, value)
+    return value
+
+
+#  Detail pages
+#  ----------------------------------------------------------------
+
+DETAILS = {
+    # model: (the show's key, the model listed on the page, its key, row prefix, genre links)
+    Venue: (Show.venue_id, Artist, Show.artist_id, 'artist', (venue_genres, venue_genres.c.venue_id)),
+    Artist: (Show.artist_id, Venue, Show.venue_id, 'venue', (artist_genres, artist_genres.c.artist_id)),
+}
+
+
+def entity_statement(model, id):
+    # the show counts are the upcoming_count/past_count counters (counters.py)
+    return select(
+        *model.__table__.c,
+        model.past_count.label('past_shows_count'),
+        model.upcoming_count.label('upcoming_shows_count')
+    ).where(model.id == id)
+
+
+def genres_statement(model, id):
+    links, key = DETAILS[model][4]
+    return select(Genre.name).join(links, links.c.genre_id == Genre.id) \
+        .where(key == id).order_by(Genre.name)
+
+
+def shows_statement(model, id, now, past, page, per_page):
+    # past shows newest first, upcoming shows soonest first, like split_shows
+    key, other, other_key, prefix, _ = DETAILS[model]
+    statement = select(
+        other.id.label(prefix + '_id'),
+        other.name.label(prefix + '_name'),
+        other.image_link.label(prefix + '_image_link'),
+        Show.start_time
+    ).join(other, other.id == other_key).where(key == id)
+    if past:
+        statement = statement.where(Show.start_time < now).order_by(Show.start_time.desc(), Show.id.desc())
+    else:
+        statement = statement.where(Show.start_time >= now).order_by(Show.start_time, Show.id)
+    if per_page:
+        statement = statement.limit(per_page).offset((page - 1) * per_page)
+    return statement
+
+
+def pages(count, per_page):
+    return max(1, -(-count // per_page)) if per_page else 1
+
+
+async def detail(model, id, past_page, upcoming_page, data, now=None):
+    # the data dict of queries.venue_detail / artist_detail
+    now = now or datetime.now()
+    past_per_page = app.config.get('PAST_SHOWS_PER_PAGE')
+    upcoming_per_page = app.config.get('UPCOMING_SHOWS_PER_PAGE')
+    past_page, upcoming_page = max(1, past_page), max(1, upcoming_page)
+    entity, genres, past, upcoming = await asyncio.gather(
+        fetch(entity_statement(model, id)),
+        fetch(genres_statement(model, id)),
+        fetch(shows_statement(model, id, now, True, past_page, past_per_page)),
+        fetch(shows_statement(model, id, now, False, upcoming_page, upcoming_per_page))
+    )
+    if not entity:
+        return None
+    entity = entity[0]
+
+    # a page past the end shows the last page, as page_of does
+    past_pages = pages(entity.past_shows_count, past_per_page)
+    upcoming_pages = pages(entity.upcoming_shows_count, upcoming_per_page)
+    if past_page > past_pages:
+        past_page = past_pages
+        past = await fetch(shows_statement(model, id, now, True, past_page, past_per_page))
+    if upcoming_page > upcoming_pages:
+        upcoming_page = upcoming_pages
+        upcoming = await fetch(shows_statement(model, id, now, False, upcoming_page, upcoming_per_page))
+
+    data = data(entity, [genre.name for genre in genres])
+    data.update({
+        "past_shows": queries.with_start_texts([row._asdict() for row in past]),
+        "upcoming_shows": queries.with_start_texts([row._asdict() for row in upcoming]),
+        "past_shows_count": entity.past_shows_count,
+        "upcoming_shows_count": entity.upcoming_shows_count,
+        "past_page": past_page,
+        "past_pages": past_pages,
+        "upcoming_page": upcoming_page,
+        "upcoming_pages": upcoming_pages
+    })
+    return data
+
+
+#  Views
+#  ----------------------------------------------------------------
+#  Same URLs, cache keys and templates as the views in app.py.
+
+async def venues():
+    genre = request.args.get('genre', '')
+
+    async def load():
+        return queries.group_areas(await fetch(queries.venue_areas_statement(genre)))
+
+    data = await memoize('venues', None, (genre,), load)
+    return render_template('pages/venues.html', areas=data, genre=genre)
+
+
+@query_budget(7)
+async def show_venue(venue_id):
+    past_page = request.args.get('past_page', 1, type=int)
+    upcoming_page = request.args.get('upcoming_page', 1, type=int)
+    data = await memoize('venue', venue_id, (past_page, upcoming_page), lambda: detail(
+        Venue, venue_id, past_page, upcoming_page, queries.venue_data
+    ))
+    if not data:
+        return render_template('pages/home.html')
+    return render_template('pages/show_venue.html', venue=data)
+
+
+async def artists():
+    genre = request.args.get('genre', '')
+    letter = request.args.get('letter', '').upper()[:1]
+    after = request.args.get('after')
+    per_page = app.config.get('ARTISTS_PER_PAGE', 60)
+
+    async def load():
+        rows, letter_rows = await asyncio.gather(
+            fetch(queries.artist_page_statement(genre, letter, after, per_page)),
+            fetch(queries.letter_counts_statement(genre))
+        )
+        return queries.artist_page_data(rows, letter_rows, per_page)
+
+    try:
+        data = await memoize('artists', None, (genre, letter, after), load)
+    except ValueError:
+        abort(400)
+    return render_template('pages/artists.html', artists=data['artists'], letters=data['letters'],
+                           next_cursor=data['next_cursor'], genre=genre, letter=letter, after=after)
+
+
+@query_budget(7)
+async def show_artist(artist_id):
+    past_page = request.args.get('past_page', 1, type=int)
+    upcoming_page = request.args.get('upcoming_page', 1, type=int)
+    data = await memoize('artist', artist_id, (past_page, upcoming_page), lambda: detail(
+        Artist, artist_id, past_page, upcoming_page, queries.artist_data
+    ))
+    if not data:
+        return render_template('pages/home.html')
+    return render_template('pages/show_artist.html', artist=data)
+
+
+async def shows():
+    after = request.args.get('after')
+    start = request.args.get('from')
+    end = request.args.get('to')
+    per_page = app.config.get('SHOWS_PER_PAGE', 30)
+
+    async def load():
+        statement = queries.shows_page_statement(
+            after,
+            dateutil.parser.parse(start) if start else None,
+            dateutil.parser.parse(end) if end else None,
+            per_page
+        )
+        return queries.shows_page_result(await fetch(statement), per_page)
+
+    try:
+        data, next_cursor = await memoize('shows', None, (after, start, end), load)
+    except (ValueError, OverflowError):
+        abort(400)
+    return render_template('pages/shows.html', shows=data, next_cursor=next_cursor,
+                           after=after, start=start, end=end)
+
+
+VIEWS = {
+    'venues': venues,
+    'show_venue': show_venue,
+    'artists': artists,
+    'show_artist': show_artist,
+    'shows': shows,
+}
+
+
+#  ASGI
+#  ----------------------------------------------------------------
+
+def preprocess_request():
+    # the before_request hooks: replica routing, the profiler and the
+    # conditional check, which may answer (304) without the view. They run the
+    # validator on the sync session and may call Redis, so they run on a
+    # worker thread, and the session goes back to the sync pool before the
+    # view awaits instead of being held for the whole request.
+    try:
+        return app.preprocess_request()
+    finally:
+        db.session.remove()
+
+
+async def respond(view, args, scope):
+    headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']]
+    with app.test_request_context(scope['path'], method=scope['method'], headers=headers,
+                                  query_string=scope['query_string'].decode('latin-1')):
+        if hasattr(view, 'query_budget'):
+            g.query_budget = view.query_budget
+        try:
+            # to_thread carries the request context over
+            rv = await asyncio.to_thread(preprocess_request)
+            response = app.make_response(rv if rv is not None else await view(**args))
+        except HTTPException as e:
+            response = app.make_response(app.handle_http_exception(e))
+        except Exception:
+            app.logger.exception('async view %s failed', request.endpoint)
+            response = app.make_response((render_template('errors/500.html'), 500))
+        # after_request hooks and the session cookie (flashed messages)
+        return app.process_response(response)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # before the server takes traffic, like gunicorn's when_ready
+            if app.config.get('WARMUP_ON_START'):
+                templating.warm(app)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for engine in list(engines.values()):
+                await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    view = None
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        try:
+            endpoint, args = app.url_map.bind('localhost').match(scope['path'], method='GET')
+            view = VIEWS.get(endpoint)
+        except HTTPException:
+            pass
+    if view is None:
+        return await wsgi(scope, receive, send)
+
+    response = await respond(view, args, scope)
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.to_wsgi_list()]
+    })
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else response.get_data()})
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, port=5000)
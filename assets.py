@@ -0,0 +1,226 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# ----------------------------------------------------------------------------#
+# Static assets.
+#
+# `flask build-assets` concatenates and minifies the stylesheets and scripts
+# of layouts/main.html into BUNDLES, copies them and every other file under
+# static/ into static/dist with a content hash in the name, rewrites the
+# url()s of the stylesheets to the hashed names and stores .gz (and, with
+# the brotli package, .br) copies of the text files next to them. Templates
+# link assets through asset_urls()/asset_url(), which read the manifest the
+# build writes and fall back to the original files while there is none. The
+# hashed files are served with an immutable far-future Cache-Control and in
+# the best encoding the client accepts.
+#
+# Optional: pip install brotli rjsmin (scripts are only concatenated without
+# rjsmin; the bundled libraries are minified already).
+# ----------------------------------------------------------------------------#
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# bundle: its files, in the order layouts/main.html loads them
+BUNDLES = {
+    'css/site.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                     'css/main.responsive.css', 'css/main.quickfix.css'],
+    'js/head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    'js/site.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.eot', '.ttf', '.otf', '.json', '.txt')
+
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+CSS_SPACE = re.compile(r'\s+')
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+URL_PARTS = re.compile(r'([^?#]*)([?#]?)(.*)')
+
+
+#  Build
+#  ----------------------------------------------------------------
+
+def minify_css(text):
+    text = CSS_COMMENT.sub('', text)
+    text = CSS_SPACE.sub(' ', text)
+    text = CSS_PUNCTUATION.sub(r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text, name):
+    if rjsmin is None or name.endswith('.min.js'):
+        return text
+    return rjsmin.jsmin(text)
+
+
+def fingerprint(name, content):
+    root, ext = posixpath.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(content).hexdigest()[:12], ext)
+
+
+def sources(static):
+    # every file under static/ outside dist/, as posix paths
+    for directory, dirs, files in os.walk(static):
+        dirs[:] = sorted(d for d in dirs if os.path.join(directory, d) != os.path.join(static, DIST))
+        for file in sorted(files):
+            if not file.startswith('.'):
+                yield os.path.relpath(os.path.join(directory, file), static).replace(os.sep, '/')
+
+
+def rewrite_urls(css, name, manifest):
+    # url(../fonts/x.woff) in css/a.css -> the path of the hashed copy, relative to dist/css/
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path, sep, suffix = URL_PARTS.match(url).groups()
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(name), path))
+        # the hashed copy, or the original when it is not there to hash
+        target = DIST + '/' + manifest[target] if target in manifest else target
+        relative = posixpath.relpath(target, DIST + '/' + posixpath.dirname(name))
+        return 'url(%s%s%s%s%s)' % (quote, relative, sep, suffix, quote)
+    return CSS_URL.sub(replace, css)
+
+
+def write(dist, name, content):
+    path = os.path.join(dist, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    if not name.endswith(COMPRESSIBLE):
+        return
+    # keep a compressed copy only where it saves something
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content) * 0.9:
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+    if brotli is not None:
+        compressed = brotli.compress(content)
+        if len(compressed) < len(content) * 0.9:
+            with open(path + '.br', 'wb') as f:
+                f.write(compressed)
+
+
+def build(static):
+    # rebuilds static/dist; returns the manifest (name -> hashed name)
+    dist = os.path.join(static, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    bundled = {name for files in BUNDLES.values() for name in files}
+    stylesheets = {}
+    for name in sources(static):
+        with open(os.path.join(static, *name.split('/')), 'rb') as f:
+            content = f.read()
+        if name.endswith('.css'):
+            # after everything they may point to is hashed
+            stylesheets[name] = content
+            continue
+        manifest[name] = fingerprint(name, content)
+        write(dist, manifest[name], content)
+
+    for name, content in sorted(stylesheets.items()):
+        css = rewrite_urls(content.decode('utf-8'), name, manifest).encode('utf-8')
+        stylesheets[name] = css
+        if name not in bundled:
+            manifest[name] = fingerprint(name, css)
+            write(dist, manifest[name], css)
+
+    for bundle, files in sorted(BUNDLES.items()):
+        if bundle.endswith('.css'):
+            content = '\n'.join(minify_css(stylesheets[name].decode('utf-8')) for name in files)
+        else:
+            parts = []
+            for name in files:
+                with open(os.path.join(static, *name.split('/')), encoding='utf-8') as f:
+                    parts.append(minify_js(f.read(), name))
+            # a script may end without a semicolon
+            content = ';\n'.join(parts)
+        content = content.encode('utf-8')
+        manifest[bundle] = fingerprint(bundle, content)
+        write(dist, manifest[bundle], content)
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+#  Templates
+#  ----------------------------------------------------------------
+
+def load_manifest(static):
+    try:
+        with open(os.path.join(static, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(name):
+    # the hashed copy of a file under static/ once built, the file itself before
+    manifest = current_app.extensions['assets']
+    if name in manifest:
+        return url_for('static', filename=DIST + '/' + manifest[name])
+    return url_for('static', filename=name)
+
+
+def asset_urls(bundle):
+    # the bundle once built, the files it is made of before
+    if bundle in current_app.extensions['assets']:
+        return [asset_url(bundle)]
+    return [asset_url(name) for name in BUNDLES[bundle]]
+
+
+#  Serving
+#  ----------------------------------------------------------------
+
+def serve_static(app):
+    # wraps the static view: hashed files get the immutable Cache-Control and
+    # their precompressed copy, everything else goes to Flask's own view
+    static, fallback = app.static_folder, app.view_functions['static']
+    hashed = set(app.extensions['assets'].values())
+    max_age = app.config.get('ASSETS_MAX_AGE', 31536000)
+
+    def static_view(filename):
+        if not filename.startswith(DIST + '/') or filename[len(DIST) + 1:] not in hashed:
+            return fallback(filename=filename)
+        path = os.path.join(static, *filename.split('/'))
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[encoding] and os.path.exists(path + suffix):
+                response = send_from_directory(static, filename + suffix, max_age=max_age,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(static, filename, max_age=max_age)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+    return static_view
+
+
+def init_app(app):
+    app.extensions['assets'] = load_manifest(app.static_folder)
+    app.jinja_env.globals.update(asset_url=asset_url, asset_urls=asset_urls)
+    app.view_functions['static'] = serve_static(app)
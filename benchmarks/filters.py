@@ -0,0 +1,88 @@
+# ----------------------------------------------------------------------------#
+# datetime filter benchmark: formats a /shows-sized list of start times with
+# the previous filter (dateutil parse and a fresh Babel pattern per call), the
+# cached filter on strings and on datetimes, and format_datetimes on the whole
+# list, after checking that all of them produce the same text.
+#
+#   python -m benchmarks.filters --values 5000 --distinct 500
+# ----------------------------------------------------------------------------#
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+import babel.dates
+import dateutil.parser
+from formatting import format_datetime, format_datetimes
+
+
+def previous_filter(value, format='medium'):
+    # the filter as it was in app.py
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def timed(f, repeat):
+    # best and median seconds of repeat runs of f()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        f()
+        samples.append(time.perf_counter() - started)
+    return min(samples), statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fyyur datetime filter benchmark')
+    parser.add_argument('--values', type=int, default=5000, help='start times per list')
+    parser.add_argument('--distinct', type=int, default=500, help='distinct start times among them')
+    parser.add_argument('--format', default='full')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    base = datetime(2026, 1, 1, 18)
+    times = [base + timedelta(days=rand.randrange(365), minutes=30 * rand.randrange(12))
+             for _ in range(args.distinct)]
+    values = [rand.choice(times) for _ in range(args.values)]
+    strings = [str(value) for value in values]
+
+    cases = [
+        ('previous filter (str)', lambda: [previous_filter(value, args.format) for value in strings]),
+        ('cached filter (str)', lambda: [format_datetime(value, args.format) for value in strings]),
+        ('cached filter (datetime)', lambda: [format_datetime(value, args.format) for value in values]),
+        ('format_datetimes (datetime)', lambda: format_datetimes(values, args.format)),
+    ]
+    expected = cases[0][1]()
+    for name, case in cases[1:]:
+        if case() != expected:
+            print('%s does not match the previous filter' % name)
+            return 1
+
+    results = {'meta': {'values': args.values, 'distinct': args.distinct, 'format': args.format}}
+    baseline = None
+    for name, case in cases:
+        best, median = timed(case, args.repeat)
+        baseline = baseline or median
+        results[name] = {'best_ms': round(best * 1000, 3), 'median_ms': round(median * 1000, 3),
+                         'us_per_value': round(median / args.values * 1e6, 3)}
+        print('%-28s %9.2f ms  %8.2f us/value  %6.1fx' % (
+            name, median * 1000, median / args.values * 1e6, baseline / median))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('saved results to %s' % args.save)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------#
+# Index benchmark: EXPLAIN plans and latencies of the Show/Venue hot paths,
+# the statements queries.py builds for the pages, with and without the
+# indexes on the Venue and Show tables.
+#
+#   python -m benchmarks.indexes --database-url postgresql://localhost/fyyur_bench
+#   python -m benchmarks.indexes --shows 200000
+# ----------------------------------------------------------------------------#
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from models import db, Venue, Show
+from benchmarks.seed import seed
+import queries
+
+INDEXES = [
+    index for table in (Venue.__table__, Show.__table__) for index in table.indexes
+]
+
+NOW = datetime.now()
+MONTH = NOW.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def hot_paths():
+    # (name, statement) of the queries the pages run, built by queries.py
+    next_month = (MONTH + timedelta(days=32)).replace(day=1)
+    return [
+        ('venues listing', queries.venue_areas_statement()),
+        ('venues listing by genre', queries.venue_areas_statement('Jazz')),
+        ('venue detail', queries.venue_detail_statement(1)),
+        ('artist detail', queries.artist_detail_statement(1)),
+        ('shows date window', queries.shows_page_statement(None, NOW, NOW + timedelta(days=7), 30)),
+        ('shows calendar', queries.calendar_counts_statement(MONTH, next_month)),
+        ('venue calendar', queries.venue_calendar_statement(1, MONTH, next_month)),
+    ]
+
+
+def driver_sql(connection, statement):
+    # the SQL and driver parameters SQLAlchemy sends for statement
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    for name, value in params.items():
+        processor = compiled.binds[name].type.dialect_impl(dialect).bind_processor(dialect)
+        if processor is not None:
+            params[name] = processor(value)
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return str(compiled), params
+
+
+def explain(connection, statement):
+    if connection.dialect.name == 'postgresql':
+        prefix = 'EXPLAIN ANALYZE '
+    else:
+        prefix = 'EXPLAIN QUERY PLAN '
+    sql, params = driver_sql(connection, statement)
+    rows = connection.exec_driver_sql(prefix + sql, params).fetchall()
+    return '\n'.join('    ' + ' | '.join(str(col) for col in row) for row in rows)
+
+
+def latency(connection, statement, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        connection.execute(statement).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(engine, label, repeat):
+    print('== %s' % label)
+    results = {}
+    with engine.connect() as connection:
+        for name, statement in hot_paths():
+            results[name] = latency(connection, statement, repeat)
+            print('-- %s: %.2f ms (median of %d)' % (name, results[name], repeat))
+            print(explain(connection, statement))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fyyur index benchmark')
+    parser.add_argument('--database-url', default='sqlite:///bench_indexes.db')
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    for index in INDEXES:
+        index.drop(engine)
+
+    started = time.perf_counter()
+    seed(engine, venues=args.venues, artists=args.artists, shows=args.shows)
+    print('seeded %d shows in %.1fs' % (args.shows, time.perf_counter() - started))
+
+    before = run(engine, 'before migration', args.repeat)
+    for index in INDEXES:
+        index.create(engine)
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+    after = run(engine, 'after migration', args.repeat)
+
+    print('== summary')
+    for name, _ in hot_paths():
+        print('%-24s %9.2f ms -> %9.2f ms' % (name, before[name], after[name]))
+
+
+if __name__ == '__main__':
+    main()
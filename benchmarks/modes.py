@@ -0,0 +1,216 @@
+# ----------------------------------------------------------------------------#
+# Sync vs async serving benchmark: seeds a catalog, starts the WSGI app
+# (threaded Werkzeug server) and the ASGI app (uvicorn, asgi.py) in turn in a
+# subprocess, and drives each with the same keep-alive HTTP load of read
+# pages from an asyncio client at high concurrency. Reports requests/sec and
+# p50/p95/p99 latency per mode.
+#
+#   python -m benchmarks.modes --size small --concurrency 64
+#   python -m benchmarks.modes --database-url postgresql://localhost/fyyur_bench --size medium
+#
+# SQLite answers in microseconds, so it mostly measures framework overhead;
+# the async mode pays off when round trips are slow, i.e. on PostgreSQL
+# over a network.
+#
+# --check runs at twice the sync pool size (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# or more, with a short DB_POOL_TIMEOUT, and exits non-zero when any request
+# fails: a mode holding a pooled connection across awaits times out there.
+#
+#   python -m benchmarks.modes --modes async --check --duration 3
+# ----------------------------------------------------------------------------#
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from sqlalchemy import create_engine
+from benchmarks.routes import percentile
+from benchmarks.seed import seed, SIZES
+
+MODES = ('sync', 'async')
+
+
+def serve(mode, port, cache_backend):
+    # runs in the subprocess
+    from app import app
+    import cache
+    app.config['CACHE_BACKEND'] = cache_backend
+    cache.init_app(app)
+    if mode == 'sync':
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        make_server('127.0.0.1', port, app, threaded=True, request_handler=QuietHandler).serve_forever()
+    else:
+        import uvicorn
+        from asgi import application
+        uvicorn.run(application, host='127.0.0.1', port=port, log_level='warning')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server on port %d did not start' % port)
+
+
+async def get(connection, path):
+    # one keep-alive GET; returns (status, connection or None once closed)
+    reader, writer = connection
+    writer.write(('GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % path).encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length, close = None, False
+    while True:
+        line = (await reader.readline()).strip().lower()
+        if not line:
+            break
+        name, _, value = line.partition(b':')
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'connection' and value.strip() == b'close':
+            close = True
+    if length is None:
+        await reader.read()
+        close = True
+    else:
+        await reader.readexactly(length)
+    if close:
+        writer.close()
+        return status, None
+    return status, connection
+
+
+async def load(port, paths, concurrency, duration):
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + duration
+
+    async def worker(seed):
+        rand = random.Random(seed)
+        connection = None
+        while time.perf_counter() < deadline:
+            path = rand.choice(paths)(rand)
+            started = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = await asyncio.open_connection('127.0.0.1', port)
+                status, connection = await get(connection, path)
+                failed = status >= 500
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                connection, failed = None, True
+            latencies.append(time.perf_counter() - started)
+            errors[0] += failed
+        if connection is not None:
+            connection[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fyyur sync vs async serving benchmark')
+    parser.add_argument('--database-url', default='sqlite:///' + os.path.abspath('bench_modes.db'))
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the catalog already in the database')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per mode')
+    parser.add_argument('--cache', default='null', help="CACHE_BACKEND to run with")
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--check', action='store_true',
+                        help='run above the pool size and fail when a request fails')
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    if args.serve:
+        serve(args.serve, args.port, args.cache)
+        return 0
+
+    env = dict(os.environ)
+    if args.check:
+        import config
+        args.concurrency = max(args.concurrency, 2 * (config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW))
+        env['DB_POOL_TIMEOUT'] = '2'
+
+    venues, artists, shows = SIZES[args.size]
+    if not args.skip_seed:
+        from models import db
+        engine = create_engine(args.database_url)
+        db.metadata.drop_all(engine)
+        db.metadata.create_all(engine)
+        seed(engine, venues=venues, artists=artists, shows=shows, skew=2.0)
+        engine.dispose()
+
+    paths = [
+        lambda rand: '/venues',
+        lambda rand: '/venues/%d' % rand.randint(1, venues),
+        lambda rand: '/artists',
+        lambda rand: '/artists/%d' % rand.randint(1, artists),
+        lambda rand: '/shows',
+    ]
+    results = {'meta': {'database': create_engine(args.database_url).dialect.name, 'size': args.size,
+                        'concurrency': args.concurrency, 'duration_s': args.duration, 'cache': args.cache}}
+    for mode in args.modes.split(','):
+        port = free_port()
+        server = subprocess.Popen([sys.executable, '-m', 'benchmarks.modes', '--serve', mode,
+                                   '--port', str(port), '--cache', args.cache,
+                                   '--database-url', args.database_url], env=env)
+        try:
+            wait_for(port)
+            asyncio.run(load(port, paths, min(args.concurrency, 4), 1.0))  # warm up
+            results[mode] = result = asyncio.run(load(port, paths, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+        print('%-6s x%-4d %8.1f req/s  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  %d errors' % (
+            mode, args.concurrency, result['throughput_rps'], result['p50_ms'], result['p95_ms'],
+            result['p99_ms'], result['errors']))
+
+    if 'sync' in results and 'async' in results and results['sync']['throughput_rps']:
+        print('async/sync throughput: %.2fx' % (
+            results['async']['throughput_rps'] / results['sync']['throughput_rps']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('saved results to %s' % args.save)
+    if args.check:
+        failed = [mode for mode in MODES if results.get(mode, {}).get('errors')]
+        if failed:
+            print('failed requests at x%d: %s' % (args.concurrency, ', '.join(failed)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# ----------------------------------------------------------------------------#
+# Query-count regression check: seeds the catalog at --venues and at ten
+# times that, requests each listing through the Flask test client and fails
+# when the number of statements it runs grows with the catalog.
+#
+#   python -m benchmarks.query_counts
+#   python -m benchmarks.query_counts --venues 100 --database-url postgresql://localhost/fyyur_bench
+# ----------------------------------------------------------------------------#
+
+import argparse
+import os
+import sys
+from sqlalchemy import event
+from benchmarks.routes import QueryCounter
+from benchmarks.seed import seed
+
+# paths whose statement count must not depend on the number of venues
+PATHS = ('/venues', '/venues?genre=Jazz')
+
+
+def count_statements(app, counter, paths):
+    # path -> statements run by one request
+    client = app.test_client()
+    counts = {}
+    for path in paths:
+        before = counter.count
+        response = client.get(path)
+        if response.status_code != 200:
+            raise SystemExit('%s answered %d' % (path, response.status_code))
+        counts[path] = counter.count - before
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fyyur query-count regression check')
+    parser.add_argument('--database-url', default='sqlite:///' + os.path.abspath('bench_query_counts.db'))
+    parser.add_argument('--venues', type=int, default=20, help='venues of the small catalog')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    from models import db
+    import cache
+    app.config.update(TESTING=True, CACHE_BACKEND='null')
+    cache.init_app(app)
+
+    counter = QueryCounter()
+    runs = []
+    for venues in (args.venues, args.venues * 10):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed(db.engine, venues=venues, artists=venues * 2, shows=venues * 10)
+            if not event.contains(db.engine, 'before_cursor_execute', counter):
+                event.listen(db.engine, 'before_cursor_execute', counter)
+        counts = count_statements(app, counter, PATHS)
+        runs.append(counts)
+        for path, n in counts.items():
+            print('%6d venues  %-24s %3d statements' % (venues, path, n))
+
+    grown = [path for path in PATHS if runs[1][path] != runs[0][path]]
+    if grown:
+        print('\nstatement count depends on the catalog size: %s' % ', '.join(grown))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,350 @@
+# ----------------------------------------------------------------------------#
+# Route benchmark: seeds a synthetic catalog, drives every route through the
+# Flask test client, then runs a concurrent HTTP load against a live server.
+# Reports p50/p95/p99 latency, throughput and queries per request, and can
+# save the results as a JSON baseline or diff them against one.
+#
+#   python -m benchmarks.routes --size small --save benchmarks/baseline.json
+#   python -m benchmarks.routes --size medium --compare benchmarks/baseline.json
+#   python -m benchmarks.routes --database-url postgresql://localhost/fyyur_bench --size large
+# ----------------------------------------------------------------------------#
+
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event
+from benchmarks.seed import seed, SIZES, GENRES, CITIES, COORDINATES
+
+
+def percentile(samples, quantile):
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * quantile))]
+
+
+def summarize(latencies, elapsed, queries, errors=0):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'queries_per_request': round(queries / len(latencies), 2) if latencies else 0.0
+    }
+
+
+def route_table(venues, artists, shows, rand):
+    # name -> (method, build(i) returning (path, form data or None))
+    now = datetime.now()
+    run = int(time.time())
+
+    def venue_id(i):
+        return rand.randint(1, venues)
+
+    def artist_id(i):
+        return rand.randint(1, artists)
+
+    def month(i):
+        # a year of calendar navigation either side of now
+        return (now + timedelta(days=rand.randint(-365, 365))).strftime('%Y-%m')
+
+    def show_form(i):
+        start = now + timedelta(days=rand.randint(1, 365))
+        return {'artist_id': artist_id(i), 'venue_id': venue_id(i),
+                'start_time': start.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def venue_form(i):
+        return {'name': 'Bench Venue %d-%d' % (run, i), 'city': 'Austin', 'state': 'TX',
+                'address': '1 Bench St', 'phone': '555-000-0000', 'genres': 'Jazz',
+                'facebook_link': 'https://www.facebook.com/bench'}
+
+    def artist_form(i):
+        return {'name': 'Bench Artist %d-%d' % (run, i), 'city': 'Austin', 'state': 'TX',
+                'phone': '555-000-0000', 'genres': 'Jazz',
+                'facebook_link': 'https://www.facebook.com/bench'}
+
+    uploads = itertools.count()
+
+    def import_file(i):
+        upload = next(uploads)
+        lines = ['name,city,state,phone,genres,facebook_link'] + [
+            'Bench Import %d-%d-%d,Austin,TX,555-000-0000,Jazz,https://www.facebook.com/bench' % (run, upload, row)
+            for row in range(10)]
+        return {'file': (io.BytesIO('\n'.join(lines).encode()), 'artists.csv')}
+
+    # venues the create_venue_submission requests added, deleted in turn
+    created_venues = itertools.count(venues + 1)
+
+    return {
+        'index': ('GET', lambda i: ('/', None)),
+        'venues': ('GET', lambda i: ('/venues', None)),
+        'venues_near': ('GET', lambda i: ('/venues/near?' + urllib.parse.urlencode(dict(zip(
+            ('lat', 'lng'), COORDINATES[rand.choice(CITIES)[0]]), radius=rand.choice((5, 25, 100)))), None)),
+        'show_venue': ('GET', lambda i: ('/venues/%d' % venue_id(i), None)),
+        'search_venues': ('POST', lambda i: ('/venues/search', {'search_term': 'venue %d' % rand.randint(1, 99)})),
+        'venues_genre': ('GET', lambda i: ('/venues?' + urllib.parse.urlencode({'genre': rand.choice(GENRES)}), None)),
+        'artists': ('GET', lambda i: ('/artists', None)),
+        'artists_letter': ('GET', lambda i: ('/artists?letter=' + chr(ord('A') + rand.randrange(26)), None)),
+        'artists_genre': ('GET', lambda i: ('/artists?' + urllib.parse.urlencode({'genre': rand.choice(GENRES)}), None)),
+        'show_artist': ('GET', lambda i: ('/artists/%d' % artist_id(i), None)),
+        'search_artists': ('POST', lambda i: ('/artists/search', {'search_term': 'artist %d' % rand.randint(1, 99)})),
+        'shows': ('GET', lambda i: ('/shows', None)),
+        'shows_window': ('GET', lambda i: ('/shows?' + urllib.parse.urlencode({
+            'from': (now + timedelta(days=rand.randint(-300, 300))).strftime('%Y-%m-%d'),
+            'to': (now + timedelta(days=rand.randint(301, 330))).strftime('%Y-%m-%d')}), None)),
+        'shows_calendar': ('GET', lambda i: ('/shows/calendar?month=' + month(i), None)),
+        'venue_calendar': ('GET', lambda i: ('/venues/%d/calendar?month=%s' % (venue_id(i), month(i)), None)),
+        'create_venue_form': ('GET', lambda i: ('/venues/create', None)),
+        'create_artist_form': ('GET', lambda i: ('/artists/create', None)),
+        'create_shows': ('GET', lambda i: ('/shows/create', None)),
+        'edit_venue': ('GET', lambda i: ('/venues/%d/edit' % venue_id(i), None)),
+        'edit_artist': ('GET', lambda i: ('/artists/%d/edit' % artist_id(i), None)),
+        'create_venue_submission': ('POST', lambda i: ('/venues/create', venue_form(i))),
+        'create_artist_submission': ('POST', lambda i: ('/artists/create', artist_form(i))),
+        'create_show_submission': ('POST', lambda i: ('/shows/create', show_form(i))),
+        'edit_venue_submission': ('POST', lambda i: ('/venues/%d/edit' % venue_id(i), venue_form(i))),
+        'edit_artist_submission': ('POST', lambda i: ('/artists/%d/edit' % artist_id(i), artist_form(i))),
+        'delete_venue': ('DELETE', lambda i: ('/venues/%d' % next(created_venues), None)),
+        'venue_free_slots': ('GET', lambda i: ('/venues/%d/free-slots?month=%s' % (venue_id(i), month(i)), None)),
+        'artists_json': ('GET', lambda i: ('/artists.json?letter=' + chr(ord('A') + rand.randrange(26)), None)),
+        'export': ('GET', lambda i: ('/export/%s.%s' % (rand.choice(('venues', 'artists')),
+                                                        rand.choice(('csv', 'ndjson'))), None)),
+        'import_upload': ('POST', lambda i: ('/_internal/import/artists', import_file(i))),
+        'cache_stats': ('GET', lambda i: ('/_internal/cache', None)),
+        'pool_stats': ('GET', lambda i: ('/_internal/pool', None)),
+        'replica_stats': ('GET', lambda i: ('/_internal/replicas', None)),
+        'api_venues': ('GET', lambda i: ('/api/v1/venues?include=shows&limit=20&after=%d' % rand.randrange(venues), None)),
+        'api_venue': ('GET', lambda i: ('/api/v1/venues/%d' % venue_id(i), None)),
+        'api_artists': ('GET', lambda i: ('/api/v1/artists?ids=' + ','.join(
+            str(artist_id(i)) for _ in range(10)), None)),
+        'api_artist': ('GET', lambda i: ('/api/v1/artists/%d?include=shows' % artist_id(i), None)),
+        'api_shows': ('GET', lambda i: ('/api/v1/shows?include=venue,artist&' + urllib.parse.urlencode({
+            'from': (now + timedelta(days=rand.randint(-300, 300))).strftime('%Y-%m-%d')}), None)),
+        'api_show': ('GET', lambda i: ('/api/v1/shows/%d' % rand.randint(1, shows), None)),
+    }
+
+
+# endpoints not benchmarked
+UNMEASURED = ('static',)
+
+
+def uncovered(app, table):
+    # 'METHOD rule' of the routes of the app without an entry in table
+    adapter = app.url_map.bind('localhost')
+    covered = set()
+    for method, build in table.values():
+        path, _ = build(0)
+        endpoint, _ = adapter.match(urllib.parse.urlsplit(path).path, method=method)
+        covered.add((endpoint, method))
+    return sorted(
+        '%s %s' % (method, rule.rule)
+        for rule in app.url_map.iter_rules() if rule.endpoint not in UNMEASURED
+        for method in rule.methods - {'HEAD', 'OPTIONS'} if (rule.endpoint, method) not in covered
+    )
+
+
+READ_ROUTES = ('venues', 'venues_genre', 'show_venue', 'search_venues', 'artists', 'artists_genre',
+               'show_artist', 'search_artists', 'shows', 'shows_window')
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.count += 1
+
+
+def run_test_client(app, table, requests):
+    counter = QueryCounter()
+    with app.app_context():
+        from models import db
+        event.listen(db.engine, 'before_cursor_execute', counter)
+    client = app.test_client()
+    # the import route only answers INTERNAL_TOKEN holders
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + app.config['INTERNAL_TOKEN']
+    for method, build in table.values():
+        # warm up: compile templates and build the search indexes
+        path, data = build(0)
+        client.open(path, method=method, data=data)
+    results = {}
+    for name, (method, build) in table.items():
+        latencies, errors, queries = [], 0, counter.count
+        started = time.perf_counter()
+        for i in range(requests):
+            path, data = build(i)
+            request_started = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            # streamed responses (the exports) run as they are read
+            response.get_data()
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code >= 500:
+                errors += 1
+        results[name] = summarize(latencies, time.perf_counter() - started,
+                                  counter.count - queries, errors)
+        print('%-26s p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  %8.1f req/s  %5.1f queries' % (
+            name, results[name]['p50_ms'], results[name]['p95_ms'], results[name]['p99_ms'],
+            results[name]['throughput_rps'], results[name]['queries_per_request']))
+    return results, counter
+
+
+def run_load(app, table, counter, concurrency, duration):
+    # mixed read workload over real HTTP against a threaded Werkzeug server
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:%d' % server.server_port
+
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(seed):
+        rand = random.Random(seed)
+        while time.perf_counter() < deadline:
+            method, build = table[rand.choice(READ_ROUTES)]
+            path, data = build(0)
+            body = urllib.parse.urlencode(data).encode() if data else None
+            started = time.perf_counter()
+            try:
+                urllib.request.urlopen(urllib.request.Request(base + path, data=body, method=method)).read()
+                failed = False
+            except (urllib.error.URLError, ConnectionError):
+                failed = True
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                errors[0] += failed
+
+    queries = counter.count
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    result = dict(summarize(latencies, elapsed, counter.count - queries, errors[0]),
+                  concurrency=concurrency, duration_s=duration)
+    print('load x%-3d                  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  %8.1f req/s  %5.1f queries' % (
+        concurrency, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+        result['throughput_rps'], result['queries_per_request']))
+    return result
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    # prints the latency / query deltas and returns the regressed entries:
+    # p50 grown by more than tolerance and min_delta_ms (p95 is too noisy to
+    # gate on) or half a query more per request
+    regressions = []
+    entries = dict(results['routes'], load=results['load'])
+    old_entries = dict(baseline.get('routes', {}), load=baseline.get('load', {}))
+    print('\n%-26s %10s %10s %8s %10s %10s %11s' % (
+        'vs baseline', 'p50 ms', 'was', 'delta', 'p95 ms', 'was', 'queries'))
+    for name, result in entries.items():
+        old = old_entries.get(name)
+        if not old or not old.get('p50_ms'):
+            continue
+        delta = (result['p50_ms'] - old['p50_ms']) / old['p50_ms']
+        more_queries = result['queries_per_request'] - old['queries_per_request'] >= 0.5
+        flag = ''
+        slower = delta > tolerance and result['p50_ms'] - old['p50_ms'] > min_delta_ms
+        if slower or more_queries:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('%-26s %10.2f %10.2f %+7.0f%% %10.2f %10.2f %5.1f/%-5.1f%s' % (
+            name, result['p50_ms'], old['p50_ms'], delta * 100, result['p95_ms'], old['p95_ms'],
+            result['queries_per_request'], old['queries_per_request'], flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fyyur route benchmark')
+    parser.add_argument('--database-url', default='sqlite:///' + os.path.abspath('bench_routes.db'))
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--skew', type=float, default=2.0)
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the catalog already in the database')
+    parser.add_argument('--requests', type=int, default=100, help='test client requests per route')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of HTTP load')
+    parser.add_argument('--cache', default='null', help="CACHE_BACKEND to run with")
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='diff against this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 growth before flagging')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='ignore p50 changes smaller than this')
+    args = parser.parse_args()
+
+    venues, artists, shows = SIZES[args.size]
+    if not args.skip_seed:
+        from models import db
+        engine = create_engine(args.database_url)
+        db.metadata.drop_all(engine)
+        db.metadata.create_all(engine)
+        started = time.perf_counter()
+        seed(engine, venues=venues, artists=artists, shows=shows, skew=args.skew)
+        print('seeded %d venues, %d artists, %d shows in %.1fs' % (
+            venues, artists, shows, time.perf_counter() - started))
+        engine.dispose()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    import cache
+    app.config['CACHE_BACKEND'] = args.cache
+    app.config['INTERNAL_TOKEN'] = app.config['INTERNAL_TOKEN'] or 'bench'
+    cache.init_app(app)
+
+    missing = uncovered(app, route_table(venues, artists, shows, random.Random(0)))
+    if missing:
+        print('routes without a benchmark entry: %s' % ', '.join(missing))
+        return 1
+    table = route_table(venues, artists, shows, random.Random(0))
+    routes, counter = run_test_client(app, table, args.requests)
+    load = run_load(app, table, counter, args.concurrency, args.duration)
+    results = {
+        'meta': {
+            'database': create_engine(args.database_url).dialect.name,
+            'size': args.size, 'venues': venues, 'artists': artists, 'shows': shows,
+            'skew': args.skew, 'cache': args.cache, 'requests': args.requests,
+            'recorded_at': datetime.now().isoformat(timespec='seconds')
+        },
+        'routes': routes,
+        'load': load
+    }
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('saved results to %s' % args.save)
+    if args.compare:
+        if not os.path.exists(args.compare):
+            print('no baseline at %s; record one with --save' % args.compare)
+            return 1
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print('\nregressed: %s' % ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
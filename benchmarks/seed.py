@@ -0,0 +1,142 @@
+# ----------------------------------------------------------------------------#
+# Synthetic catalog generator for the benchmarks.
+# ----------------------------------------------------------------------------#
+
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam
+from models import Venue, Artist, ArtistLetter, Show, Genre, venue_genres, artist_genres, SHOW_LENGTH
+
+CITIES = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+    ('Brooklyn', 'NY'), ('Austin', 'TX'), ('Houston', 'TX'), ('Seattle', 'WA'),
+    ('Chicago', 'IL'), ('Nashville', 'TN'), ('New Orleans', 'LA'),
+]
+# city: (latitude, longitude), as in data/gazetteer.csv
+COORDINATES = {
+    'San Francisco': (37.7749, -122.4194), 'Los Angeles': (34.0522, -118.2437), 'New York': (40.7128, -74.0060),
+    'Brooklyn': (40.6782, -73.9442), 'Austin': (30.2672, -97.7431), 'Houston': (29.7604, -95.3698),
+    'Seattle': (47.6062, -122.3321), 'Chicago': (41.8781, -87.6298), 'Nashville': (36.1627, -86.7816),
+    'New Orleans': (29.9511, -90.0715),
+}
+GENRES = ['Jazz', 'Reggae', 'Swing', 'Classical', 'Folk', 'Rock n Roll', 'Blues', 'Hip-Hop']
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+SIZES = {
+    # name: (venues, artists, shows)
+    'small': (50, 200, 1000),
+    'medium': (2000, 10000, 100000),
+    'large': (10000, 50000, 1000000),
+}
+
+
+def skewed(rand, n, skew):
+    # an id in 1..n; skew 1 is uniform, larger values pile shows onto the
+    # low ids the way a few popular venues/artists dominate a real catalog
+    return min(n, int(n * rand.random() ** skew) + 1)
+
+
+def seed(engine, venues=500, artists=1000, shows=50000, batch_size=10000, random_seed=0, skew=1.0):
+    # bulk inserts a synthetic catalog with executemany batches, spreading
+    # shows (never two at once for a venue or an artist) a year either side
+    # of now, then fills in the upcoming/past counters from what was generated.
+    rand = random.Random(random_seed)
+    now = datetime.now()
+    counters = {Venue: {}, Artist: {}}
+
+    def venue_rows():
+        for i in range(1, venues + 1):
+            city, state = rand.choice(CITIES)
+            # spread over about 20 miles around the city
+            latitude, longitude = COORDINATES[city]
+            yield {
+                'id': i, 'name': 'Venue %d' % i, 'city': city, 'state': state,
+                'latitude': latitude + rand.uniform(-0.15, 0.15), 'longitude': longitude + rand.uniform(-0.15, 0.15),
+                'address': '%d Main St' % i, 'phone': '555-000-%04d' % (i % 10000),
+                'facebook_link': 'https://www.facebook.com/venue%d' % i, 'seeking_talent': False,
+                'seeking_description': ''
+            }
+
+    def artist_rows():
+        for i in range(1, artists + 1):
+            city, state = rand.choice(CITIES)
+            # spread over the A-Z index of /artists
+            letter = chr(ord('A') + i % 26)
+            yield {
+                'id': i, 'name': '%s Artist %d' % (letter, i), 'letter': letter, 'city': city, 'state': state,
+                'phone': '555-100-%04d' % (i % 10000),
+                'seeking_venue': False, 'seeking_description': ''
+            }
+
+    def genre_rows(key, n):
+        # two genres per venue/artist
+        for i in range(1, n + 1):
+            for genre_id in rand.sample(range(1, len(GENRES) + 1), 2):
+                yield {key: i, 'genre_id': genre_id}
+
+    def show_rows():
+        # shows fill SHOW_LENGTH slots a year either side of now; a slot the
+        # venue or the artist has already is drawn again (with other ids
+        # after a few tries), as booking would refuse it
+        slots = int(timedelta(days=365) / SHOW_LENGTH)
+        # id * width + slot, per side
+        width = 2 * slots + 1
+        venue_slots, artist_slots = set(), set()
+        for i in range(1, shows + 1):
+            for attempt in range(100):
+                shape = skew if attempt < 10 else 1.0
+                venue_id, artist_id = skewed(rand, venues, shape), skewed(rand, artists, shape)
+                slot = rand.randint(-slots, slots)
+                if venue_id * width + slot not in venue_slots and artist_id * width + slot not in artist_slots:
+                    break
+            venue_slots.add(venue_id * width + slot)
+            artist_slots.add(artist_id * width + slot)
+            start_time = now + slot * SHOW_LENGTH
+            row = {'id': i, 'venue_id': venue_id, 'artist_id': artist_id,
+                   'start_time': start_time, 'end_time': start_time + SHOW_LENGTH}
+            for model, id in ((Venue, row['venue_id']), (Artist, row['artist_id'])):
+                upcoming, past, next_show_at = counters[model].get(id, (0, 0, None))
+                if row['start_time'] > now:
+                    upcoming += 1
+                    next_show_at = min(next_show_at or row['start_time'], row['start_time'])
+                else:
+                    past += 1
+                counters[model][id] = (upcoming, past, next_show_at)
+            yield row
+
+    with engine.begin() as connection:
+        for table, rows in ((Genre.__table__, ({'id': i, 'name': name} for i, name in enumerate(GENRES, 1))),
+                            (Venue.__table__, venue_rows()),
+                            (Artist.__table__, artist_rows()),
+                            (venue_genres, genre_rows('venue_id', venues)),
+                            (artist_genres, genre_rows('artist_id', artists)),
+                            (Show.__table__, show_rows())):
+            for batch in batches(rows, batch_size):
+                connection.execute(table.insert(), batch)
+
+        for model, counts in counters.items():
+            table = model.__table__
+            statement = table.update().where(table.c.id == bindparam('entity_id')).values(
+                upcoming_count=bindparam('upcoming'), past_count=bindparam('past'),
+                next_show_at=bindparam('next_show')
+            )
+            rows = (
+                {'entity_id': id, 'upcoming': upcoming, 'past': past, 'next_show': next_show_at}
+                for id, (upcoming, past, next_show_at) in counts.items()
+            )
+            for batch in batches(rows, batch_size):
+                connection.execute(statement, batch)
+        connection.execute(ArtistLetter.__table__.insert(), [
+            {'letter': chr(ord('A') + n), 'count': len(range(n or 26, artists + 1, 26))} for n in range(26)
+        ])
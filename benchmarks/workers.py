@@ -0,0 +1,105 @@
+# ----------------------------------------------------------------------------#
+# gunicorn worker model benchmark: seeds a catalog, then for each worker
+# class starts `gunicorn -c gunicorn.conf.py wsgi:app`, times how long it
+# takes to answer its first request and measures steady-state requests/sec
+# and latency under a keep-alive load of read pages.
+#
+#   python -m benchmarks.workers --size small --workers 2 --concurrency 64
+#   python -m benchmarks.workers --database-url postgresql://localhost/fyyur_bench --classes sync,gthread
+# ----------------------------------------------------------------------------#
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from sqlalchemy import create_engine
+from benchmarks.modes import free_port, load
+from benchmarks.seed import seed, SIZES
+
+CLASSES = ('sync', 'gthread', 'gevent')
+
+
+def started(port, timeout=60):
+    # seconds until the server answers its first request
+    began = time.perf_counter()
+    while time.perf_counter() - began < timeout:
+        try:
+            urllib.request.urlopen('http://127.0.0.1:%d/' % port, timeout=1).read()
+            return time.perf_counter() - began
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.02)
+    raise RuntimeError('gunicorn on port %d did not start' % port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fyyur gunicorn worker model benchmark')
+    parser.add_argument('--database-url', default='sqlite:///' + os.path.abspath('bench_workers.db'))
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the catalog already in the database')
+    parser.add_argument('--classes', default=','.join(CLASSES))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='threads per gthread worker')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per worker class')
+    parser.add_argument('--cache', default='null', help="CACHE_BACKEND to run with")
+    parser.add_argument('--save', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    venues, artists, shows = SIZES[args.size]
+    if not args.skip_seed:
+        os.environ['DATABASE_URL'] = args.database_url
+        from models import db
+        engine = create_engine(args.database_url)
+        db.metadata.drop_all(engine)
+        db.metadata.create_all(engine)
+        seed(engine, venues=venues, artists=artists, shows=shows, skew=2.0)
+        engine.dispose()
+
+    paths = [
+        lambda rand: '/venues',
+        lambda rand: '/venues/%d' % rand.randint(1, venues),
+        lambda rand: '/artists',
+        lambda rand: '/artists/%d' % rand.randint(1, artists),
+        lambda rand: '/shows',
+    ]
+    results = {'meta': {'database': create_engine(args.database_url).dialect.name, 'size': args.size,
+                        'workers': args.workers, 'threads': args.threads,
+                        'concurrency': args.concurrency, 'duration_s': args.duration, 'cache': args.cache}}
+    for worker_class in args.classes.split(','):
+        if worker_class == 'gevent' and importlib.util.find_spec('gevent') is None:
+            print('%-8s skipped, gevent is not installed' % worker_class)
+            continue
+        port = free_port()
+        env = dict(os.environ, DATABASE_URL=args.database_url, FYYUR_ENV='production',
+                   WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(args.workers),
+                   WORKER_THREADS=str(args.threads), CACHE_BACKEND=args.cache,
+                   BIND='127.0.0.1:%d' % port)
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                                  env=env, stderr=subprocess.DEVNULL)
+        try:
+            startup = started(port)
+            asyncio.run(load(port, paths, min(args.concurrency, 4), 1.0))  # warm up
+            result = asyncio.run(load(port, paths, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+        results[worker_class] = dict(result, startup_s=round(startup, 3))
+        print('%-8s startup %6.2f s  %8.1f req/s  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  %d errors' % (
+            worker_class, startup, result['throughput_rps'], result['p50_ms'], result['p95_ms'],
+            result['p99_ms'], result['errors']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('saved results to %s' % args.save)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+from datetime import datetime
+from sqlalchemy import select, or_
+from sqlalchemy.exc import IntegrityError
+from models import db, Venue, Artist, Show, SHOW_LENGTH, SHOW_MAX_LENGTH
+
+# ----------------------------------------------------------------------------#
+# Show booking.
+#
+# A show holds its venue and its artist from start_time until end_time. On
+# PostgreSQL two exclusion constraints (btree_gist, see models.Show) keep
+# them from being booked twice at once; conflict() recognizes the error.
+# Elsewhere check() looks for overlapping shows before the insert. Both the
+# lookups here and free_slots() seek ix_Show_venue_id_start_time /
+# ix_Show_artist_id_start_time: since no show runs past SHOW_MAX_LENGTH, only
+# shows starting within that much before a range can overlap it. Imports
+# check each batch against an IntervalTree of the shows already booked.
+# ----------------------------------------------------------------------------#
+
+# the SQLSTATE of exclusion_violation
+EXCLUSION_VIOLATION = '23P01'
+
+
+class BookingError(ValueError):
+    pass
+
+
+class BookingConflict(BookingError):
+
+    def __init__(self, shows):
+        super(BookingConflict, self).__init__('overlaps show %s' % ', '.join(str(show.id) for show in shows))
+        self.shows = shows
+
+
+#  Interval tree
+#  ----------------------------------------------------------------
+
+class IntervalTree(object):
+    # half-open [start, end) intervals with a value each, in a binary search
+    # tree on start where every node also keeps the latest end below it, so
+    # overlapping() skips the subtrees that end before the range. Built
+    # balanced from the intervals given; add() does not rebalance.
+
+    def __init__(self, intervals=()):
+        self.root = self.build(sorted(intervals, key=lambda interval: interval[:2]))
+        self.size = len(intervals)
+
+    def build(self, intervals):
+        if not intervals:
+            return None
+        middle = len(intervals) // 2
+        start, end, value = intervals[middle]
+        node = [start, end, value, self.build(intervals[:middle]), self.build(intervals[middle + 1:]), end]
+        for child in node[3:5]:
+            if child is not None and child[5] > node[5]:
+                node[5] = child[5]
+        return node
+
+    def __len__(self):
+        return self.size
+
+    def add(self, start, end, value):
+        self.size += 1
+        new = [start, end, value, None, None, end]
+        if self.root is None:
+            self.root = new
+            return
+        node = self.root
+        while True:
+            if end > node[5]:
+                node[5] = end
+            side = 3 if (start, end) < (node[0], node[1]) else 4
+            if node[side] is None:
+                node[side] = new
+                return
+            node = node[side]
+
+    def overlapping(self, start, end):
+        # the values of the intervals overlapping [start, end), by start
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or node[5] <= start:
+                continue
+            # right subtree and this node only start later
+            if node[0] < end:
+                stack.append(node[4])
+                if node[1] > start:
+                    found.append(node)
+            stack.append(node[3])
+        return [node[2] for node in sorted(found, key=lambda node: (node[0], node[1]))]
+
+
+#  Checks
+#  ----------------------------------------------------------------
+
+def span(start_time, end_time=None):
+    # (start_time, end_time) of a show, SHOW_LENGTH long when end_time is empty
+    end_time = end_time or start_time + SHOW_LENGTH
+    if end_time <= start_time:
+        raise BookingError('a show must end after it starts')
+    if end_time - start_time > SHOW_MAX_LENGTH:
+        raise BookingError('a show may run %d hours at most' % (SHOW_MAX_LENGTH.total_seconds() // 3600))
+    return start_time, end_time
+
+
+def enforced_by_database():
+    return db.session.get_bind(Show).dialect.name == 'postgresql'
+
+
+def during(key, ids, start_time, end_time):
+    # shows of key in ids overlapping [start_time, end_time)
+    return (Show.start_time > start_time - SHOW_MAX_LENGTH, Show.start_time < end_time,
+            Show.end_time > start_time, key.in_(ids))
+
+
+def overlapping_statement(venue_id, artist_id, start_time, end_time):
+    venue, artist = during(Show.venue_id, [venue_id], start_time, end_time), \
+        during(Show.artist_id, [artist_id], start_time, end_time)
+    return select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time) \
+        .where(or_(db.and_(*venue), db.and_(*artist))).order_by(Show.start_time, Show.id)
+
+
+def parties_exist(venue_id, artist_id):
+    # whether both the venue and the artist exist, in one round trip
+    return db.session.execute(select(
+        select(Venue.id).where(Venue.id == venue_id).exists(),
+        select(Artist.id).where(Artist.id == artist_id).exists()
+    )).one() == (True, True)
+
+
+def check(venue_id, artist_id, start_time, end_time):
+    # raises BookingConflict when the venue or the artist is booked during
+    # the show; a no-op where the database enforces it
+    if enforced_by_database():
+        return
+    shows = db.session.execute(overlapping_statement(venue_id, artist_id, start_time, end_time)).all()
+    if shows:
+        raise BookingConflict(shows)
+
+
+def conflict(error):
+    # whether an IntegrityError is one of the Show exclusion constraints
+    return isinstance(error, IntegrityError) and getattr(error.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
+
+def check_batch(rows):
+    # splits import rows (dicts with line, venue_id, artist_id, start_time
+    # and end_time) into those that can be booked and (row, reason) for those
+    # that overlap a booked show or an earlier row of the batch; one query
+    # per side
+    if not rows:
+        return [], []
+    start = min(row['start_time'] for row in rows)
+    end = max(row['end_time'] for row in rows)
+    trees = {}
+    for side in ('venue', 'artist'):
+        key = getattr(Show, side + '_id')
+        ids = {row[side + '_id'] for row in rows}
+        booked = {id: [] for id in ids}
+        for id, show_id, show_start, show_end in db.session.execute(
+                select(key, Show.id, Show.start_time, Show.end_time).where(*during(key, ids, start, end))):
+            booked[id].append((show_start, show_end, 'show %d' % show_id))
+        trees.update(((side, id), IntervalTree(intervals)) for id, intervals in booked.items())
+
+    accepted, rejected = [], []
+    for row in rows:
+        sides = [(side, trees[side, row[side + '_id']]) for side in ('venue', 'artist')]
+        for side, tree in sides:
+            overlaps = tree.overlapping(row['start_time'], row['end_time'])
+            if overlaps:
+                rejected.append((row, 'the %s is booked then (%s)' % (side, ', '.join(overlaps))))
+                break
+        else:
+            for side, tree in sides:
+                tree.add(row['start_time'], row['end_time'], 'line %d' % row['line'])
+            accepted.append(row)
+    return accepted, rejected
+
+
+#  Free slots
+#  ----------------------------------------------------------------
+
+def month_of(value=None, now=None):
+    # the [first, next first) of a 'YYYY-MM' month, this month by default
+    first = datetime.strptime(value, '%Y-%m') if value else (now or datetime.now()).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0)
+    return first, first.replace(year=first.year + first.month // 12, month=first.month % 12 + 1)
+
+
+def free_slots_statement(venue_id, start, end):
+    return select(Show.start_time, Show.end_time) \
+        .where(*during(Show.venue_id, [venue_id], start, end)).order_by(Show.start_time)
+
+
+def free_slots_data(rows, start, end, length):
+    # the gaps of at least length between start and end the shows leave free
+    slots = []
+    for show_start, show_end in list(rows) + [(end, end)]:
+        if show_start - start >= length:
+            slots.append({'start_time': start, 'end_time': min(show_start, end)})
+        start = max(start, show_end)
+    return slots
+
+
+def free_slots(venue_id, start, end, length=SHOW_LENGTH):
+    return free_slots_data(db.session.execute(free_slots_statement(venue_id, start, end)), start, end, length)
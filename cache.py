@@ -0,0 +1,340 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import pickle
+import socket
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlparse
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from models import db, Show
+
+# ----------------------------------------------------------------------------#
+# Cache.
+#
+# Read routes cache their assembled view dicts (memoize) and templates cache
+# their rendered fragments ({% cache kind, id, ... %}). Every key lives under
+# an entity generation ("venue", 3) / listing generation ("venues", None);
+# the write handlers bump exactly the affected generations, which orphans the
+# old entries until they are evicted or expire.
+# ----------------------------------------------------------------------------#
+
+MISSING = object()
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations
+        }
+
+
+class NullCache(object):
+
+    def __init__(self):
+        self.stats = Stats()
+
+    def get(self, key):
+        self.stats.misses += 1
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def generation(self, name):
+        return 0
+
+    def bump(self, name):
+        self.stats.invalidations += 1
+
+    def info(self):
+        return dict(self.stats.as_dict(), backend='null')
+
+
+class LRUCache(object):
+    # in-process cache; least recently used entries are evicted past
+    # max_entries and entries expire ttl seconds after they were set.
+
+    def __init__(self, max_entries=10000, default_ttl=60):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.stats = Stats()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (ttl or self.default_ttl)
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def generation(self, name):
+        return self.generations.get(name, 0)
+
+    def bump(self, name):
+        # generations are never evicted, so an orphaned entry can not come back
+        with self.lock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+            self.stats.invalidations += 1
+
+    def info(self):
+        return dict(self.stats.as_dict(), backend='memory', entries=len(self.entries),
+                    max_entries=self.max_entries)
+
+
+class RedisCache(object):
+    # speaks the Redis protocol (RESP) directly over one socket per thread;
+    # values are pickled. Generation counters are stored without a TTL, so
+    # run Redis with a volatile-* maxmemory policy.
+
+    def __init__(self, url, default_ttl=60, prefix='fyyur:', timeout=1.0):
+        url = urlparse(url)
+        self.address = (url.hostname or 'localhost', url.port or 6379)
+        self.password = url.password
+        self.database = int(url.path.strip('/') or 0)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local = threading.local()
+        self.stats = Stats()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection(self.address, self.timeout)
+            conn = self.local.conn = (sock, sock.makefile('rb'))
+            if self.password:
+                self.command('AUTH', self.password)
+            if self.database:
+                self.command('SELECT', self.database)
+        return conn
+
+    def command(self, *args):
+        sock, reader = self.connection()
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        try:
+            sock.sendall(b''.join(parts))
+            return self.reply(reader)
+        except (OSError, EOFError):
+            self.local.conn = None
+            sock.close()
+            raise
+
+    def reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise EOFError('connection closed by Redis')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest
+        if kind == b'-':
+            raise RuntimeError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            if rest == b'-1':
+                return None
+            data = reader.read(int(rest) + 2)
+            return data[:-2]
+        if kind == b'*':
+            if rest == b'-1':
+                return None
+            return [self.reply(reader) for _ in range(int(rest))]
+        raise RuntimeError('unexpected Redis reply %r' % line)
+
+    def get(self, key):
+        try:
+            data = self.command('GET', self.prefix + key)
+        except (OSError, EOFError):
+            data = None
+        if data is None:
+            self.stats.misses += 1
+            return MISSING
+        self.stats.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        ttl = int((ttl or self.default_ttl) * 1000)
+        try:
+            self.command('SET', self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), 'PX', ttl)
+        except (OSError, EOFError):
+            pass
+
+    def generation(self, name):
+        try:
+            return int(self.command('GET', self.prefix + 'generation:' + name) or 0)
+        except (OSError, EOFError):
+            return 0
+
+    def bump(self, name):
+        self.command('INCR', self.prefix + 'generation:' + name)
+        self.stats.invalidations += 1
+
+    def info(self):
+        info = dict(self.stats.as_dict(), backend='redis')
+        try:
+            for line in self.command('INFO', 'stats').decode().splitlines():
+                if line.startswith(('evicted_keys:', 'expired_keys:')):
+                    name, value = line.split(':')
+                    info['server_' + name] = int(value)
+        except (OSError, EOFError, RuntimeError):
+            pass
+        return info
+
+
+def init_app(app):
+    # CACHE_BACKEND picks 'memory', 'redis' or 'null' (caching disabled)
+    name = app.config.get('CACHE_BACKEND', 'memory')
+    ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+    if name == 'redis':
+        backend = RedisCache(app.config['CACHE_REDIS_URL'], default_ttl=ttl)
+    elif name == 'memory':
+        backend = LRUCache(app.config.get('CACHE_MAX_ENTRIES', 10000), default_ttl=ttl)
+    else:
+        backend = NullCache()
+    app.extensions['cache'] = backend
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    return backend
+
+
+def backend():
+    return current_app.extensions['cache']
+
+
+def shared():
+    # whether every worker sees the same entries (and so every invalidation)
+    return isinstance(backend(), RedisCache)
+
+
+def entity_name(kind, id=None):
+    return kind if id is None else '%s:%s' % (kind, id)
+
+
+def make_key(kind, id, parts):
+    name = entity_name(kind, id)
+    generation = backend().generation(name)
+    return ':'.join([name, str(generation)] + [str(part) for part in parts])
+
+
+def memoize(kind, id, parts, loader, ttl=None):
+    # view dicts: returns the cached value or stores loader()'s; None is not cached
+    key = make_key(kind, id, ('data',) + tuple(parts))
+    value = backend().get(key)
+    if value is MISSING:
+        value = loader()
+        if value is not None:
+            backend().set(key, value, ttl)
+    return value
+
+
+def logged(f):
+    # invalidation runs after the write has committed: a backend error is
+    # logged (the entries then live out their TTL) instead of failing the write
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            f(*args, **kwargs)
+        except Exception:
+            current_app.logger.exception('cache invalidation failed: %s%r', f.__name__, args)
+    return wrapper
+
+
+@logged
+def invalidate(*names):
+    # names are (kind, id) pairs, id None for listings
+    for kind, id in set(names):
+        backend().bump(entity_name(kind, id))
+
+
+@logged
+def invalidate_venue(venue_id):
+    # the venue page, the listings showing its name and every artist page
+    # listing one of its shows
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+    invalidate(('venue', venue_id), ('venues', None), ('shows', None),
+               *[('artist', artist_id) for artist_id, in artist_ids])
+
+
+@logged
+def invalidate_artist(artist_id):
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+    invalidate(('artist', artist_id), ('artists', None), ('shows', None),
+               *[('venue', venue_id) for venue_id, in venue_ids])
+
+
+@logged
+def invalidate_show(venue_id, artist_id, start_time=None):
+    # start_time also drops the /shows/calendar counts of its month
+    names = [('venue', venue_id), ('artist', artist_id), ('venues', None), ('shows', None)]
+    if start_time is not None:
+        names.append(('month', start_time.strftime('%Y-%m')))
+    invalidate(*names)
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache 'venue', venue.id, venue.past_page %}...{% endcache %} caches the
+    # rendered block under the generation of ('venue', venue.id)
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache_fragment', [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_fragment(self, args, caller):
+        kind, id, parts = args[0], args[1] if len(args) > 1 else None, args[2:]
+        key = make_key(kind, id, ['html'] + list(parts))
+        value = backend().get(key)
+        if value is MISSING:
+            value = caller()
+            backend().set(key, str(value))
+        return Markup(value)
@@ -0,0 +1,129 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+from datetime import datetime
+from collections import Counter
+from sqlalchemy import select, func, insert, delete
+from models import db, Venue, Artist, Show, ArtistLetter
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry upcoming_count, past_count and next_show_at so the
+# read pages never aggregate Show. The helpers below run inside the caller's
+# transaction: call them after adding/removing a show and before commit.
+# roll_over() is the periodic job (`flask roll-over-shows`) that moves shows
+# whose start_time has passed from upcoming to past.
+# ----------------------------------------------------------------------------#
+
+COUNTED = (
+    (Venue, Show.venue_id),
+    (Artist, Show.artist_id),
+)
+
+
+def adjust(venue_id, artist_id, start_time, delta, now):
+    db.session.flush()
+    for model, id in ((Venue, venue_id), (Artist, artist_id)):
+        entity = db.session.query(model).filter(model.id == id)
+        if start_time <= now:
+            entity.update({model.past_count: model.past_count + delta}, synchronize_session=False)
+            continue
+        entity.update({model.upcoming_count: model.upcoming_count + delta}, synchronize_session=False)
+        if delta > 0:
+            entity.filter(db.or_(model.next_show_at.is_(None), model.next_show_at > start_time)) \
+                .update({model.next_show_at: start_time}, synchronize_session=False)
+        else:
+            entity.filter(model.next_show_at == start_time) \
+                .update({model.next_show_at: next_show(model, now)}, synchronize_session=False)
+
+
+def show_added(show, now=None):
+    adjust(show.venue_id, show.artist_id, show.start_time, 1, now or datetime.now())
+
+
+def show_removed(show, now=None):
+    # call after deleting the show
+    adjust(show.venue_id, show.artist_id, show.start_time, -1, now or datetime.now())
+
+
+def show_rescheduled(show, old_start_time, now=None):
+    # call after changing show.start_time
+    now = now or datetime.now()
+    adjust(show.venue_id, show.artist_id, old_start_time, -1, now)
+    adjust(show.venue_id, show.artist_id, show.start_time, 1, now)
+
+
+def next_show(model, now):
+    key = dict(COUNTED)[model]
+    return select(func.min(Show.start_time)) \
+        .where(key == model.id).where(Show.start_time > now).scalar_subquery()
+
+
+def recount(model, now, stale_only=True, ids=None):
+    # recomputes the counters with one correlated UPDATE; with stale_only only
+    # the rows whose next show has already started are touched, with ids
+    # only those rows.
+    key = dict(COUNTED)[model]
+    upcoming = select(func.count(Show.id)).where(key == model.id).where(Show.start_time > now)
+    past = select(func.count(Show.id)).where(key == model.id).where(Show.start_time <= now)
+    query = db.session.query(model)
+    if stale_only:
+        query = query.filter(model.next_show_at <= now)
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+    return query.update({
+        model.upcoming_count: upcoming.scalar_subquery(),
+        model.past_count: past.scalar_subquery(),
+        model.next_show_at: next_show(model, now)
+    }, synchronize_session=False)
+
+
+def roll_over(now=None, stale_only=True):
+    # returns the number of venues and artists whose counters changed
+    now = now or datetime.now()
+    rows = {model.__tablename__: recount(model, now, stale_only) for model, _ in COUNTED}
+    db.session.commit()
+    return rows
+
+
+# ----------------------------------------------------------------------------#
+# Letter counts.
+#
+# ArtistLetter holds the number of artists per index letter for the A-Z bar
+# of /artists. Like the show counters, the helpers run in the caller's
+# transaction; recount_letters() rebuilds the table from Artist.
+# ----------------------------------------------------------------------------#
+
+def adjust_letters(deltas):
+    # deltas: letter -> change in the number of artists
+    for letter, delta in deltas.items():
+        if not delta:
+            continue
+        updated = db.session.query(ArtistLetter).filter(ArtistLetter.letter == letter) \
+            .update({ArtistLetter.count: ArtistLetter.count + delta}, synchronize_session=False)
+        if not updated:
+            db.session.execute(insert(ArtistLetter).values(letter=letter, count=max(delta, 0)))
+
+
+def artist_added(artist):
+    adjust_letters({artist.letter: 1})
+
+
+def artist_renamed(artist, old_letter):
+    # call after setting artist.name
+    if artist.letter != old_letter:
+        adjust_letters({old_letter: -1, artist.letter: 1})
+
+
+def artists_added(letters):
+    # letters: the letter of every artist inserted
+    adjust_letters(Counter(letters))
+
+
+def recount_letters():
+    db.session.execute(delete(ArtistLetter))
+    db.session.execute(insert(ArtistLetter).from_select(
+        ['letter', 'count'], select(Artist.letter, func.count(Artist.id)).group_by(Artist.letter)
+    ))
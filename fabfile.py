@@ -5,10 +5,20 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # query counts that must not grow with the catalog, then the route
+    # benchmark, failing when it regresses against the saved baseline: any
+    # extra query per request, or a p50 that doubles (the committed baseline
+    # comes from another machine; record your own for finer latency checks),
+    # then both serving modes at more concurrent requests than the pool holds
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local("python -m benchmarks.query_counts", capture=True)
+        if result.succeeded:
+            result = local(
+                "python -m benchmarks.routes --size small --compare benchmarks/baseline.json --tolerance 1.0",
+                capture=True
+            )
+        if result.succeeded:
+            result = local("python -m benchmarks.modes --check --duration 3", capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
@@ -0,0 +1,67 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+from datetime import datetime, timezone
+from functools import lru_cache
+import babel
+import babel.dates
+import dateutil.parser
+
+# ----------------------------------------------------------------------------#
+# Date formatting.
+#
+# format_datetime is the `datetime` template filter. Datetimes (Show.start_time)
+# are used as they are, and only strings are parsed. The Babel pattern of each
+# (format, locale) pair is compiled once and reused. format_datetimes formats
+# a whole list, each distinct value once, for views rendering many shows
+# (queries.with_start_texts).
+# Output matches babel.dates.format_datetime.
+# ----------------------------------------------------------------------------#
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def locale_of(name):
+    return babel.Locale.parse(name)
+
+
+@lru_cache(maxsize=256)
+def pattern_of(format, locale):
+    # the compiled DateTimePattern; None for Babel's own 'short'/'long' styles
+    format = FORMATS.get(format, format)
+    if format in ('short', 'long'):
+        return None
+    return babel.dates.parse_pattern(format)
+
+
+def as_datetime(value):
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = dateutil.parser.parse(value)
+    # naive values are read as UTC, as babel.dates.format_datetime does
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def format_datetime(value, format='medium', locale=None):
+    locale = locale or babel.dates.LC_TIME
+    value = as_datetime(value)
+    pattern = pattern_of(format, locale)
+    if pattern is None:
+        return babel.dates.format_datetime(value, format, locale=locale)
+    return pattern.apply(value, locale_of(locale))
+
+
+def format_datetimes(values, format='medium', locale=None):
+    # one formatted string per value
+    formatted = {}
+    for value in values:
+        if value not in formatted:
+            formatted[value] = format_datetime(value, format, locale)
+    return [formatted[value] for value in values]
@@ -0,0 +1,334 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import csv
+import math
+import os
+import re
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, event, func, inspect, select
+from sqlalchemy.orm import Session
+from werkzeug.utils import import_string
+from models import db, Venue
+
+# ----------------------------------------------------------------------------#
+# Venue locations.
+#
+# Venues are geocoded from address, city and state when they are flushed
+# (and by the importer) through the GEOCODER. The default one reads a local
+# gazetteer CSV (address, city, state, latitude, longitude; address may be
+# empty for a city-wide entry), so nothing goes over the network. Any class
+# taking the app can be plugged in by its import path.
+#
+# near() answers "venues within radius miles of a point", nearest first. The
+# PostgreSQL backend relies on the earthdistance GiST index on
+# ll_to_earth(latitude, longitude) (migration f2c6a9d4b8e1); the in-memory
+# backend keeps a KD-tree of the venues' points on the unit sphere for SQLite
+# and test runs, built on first use and kept up to date from committed
+# sessions like search.MemorySearch.
+# ----------------------------------------------------------------------------#
+
+EARTH_RADIUS_MILES = 3958.8
+METERS_PER_MILE = 1609.344
+LOCATED = ('address', 'city', 'state')
+ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'boulevard': 'blvd', 'drive': 'dr',
+    'place': 'pl', 'lane': 'ln', 'north': 'n', 'south': 's', 'east': 'e', 'west': 'w', 'saint': 'st',
+}
+PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+def normalized(text):
+    words = PUNCTUATION.sub(' ', (text or '').lower()).split()
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+#  Geocoders
+#  ----------------------------------------------------------------
+
+class GazetteerGeocoder(object):
+    # exact address matches first, then the city; loaded on first use
+
+    def __init__(self, app):
+        self.path = app.config.get('GAZETTEER_PATH')
+        self.places = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        places = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    key = (normalized(row['address']), normalized(row['city']), normalized(row['state']))
+                    places[key] = (float(row['latitude']), float(row['longitude']))
+        return places
+
+    def geocode(self, address, city, state):
+        # (latitude, longitude), or None when the gazetteer has neither
+        with self.lock:
+            if self.places is None:
+                self.places = self.load()
+        city, state = normalized(city), normalized(state)
+        return self.places.get((normalized(address), city, state)) or self.places.get(('', city, state))
+
+
+class NullGeocoder(object):
+
+    def __init__(self, app):
+        pass
+
+    def geocode(self, address, city, state):
+        return None
+
+
+GEOCODERS = {'gazetteer': GazetteerGeocoder, 'none': NullGeocoder}
+
+
+def geocode(address, city, state):
+    return current_app.extensions['geocoder'].geocode(address, city, state)
+
+
+def locate(session, flush_context, instances):
+    # before_flush: (re)geocodes the venues added or moved
+    if not has_app_context() or 'geocoder' not in current_app.extensions:
+        return
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Venue):
+            continue
+        state = inspect(obj)
+        if obj in session.new or any(state.attrs[name].history.has_changes() for name in LOCATED):
+            obj.latitude, obj.longitude = geocode(obj.address, obj.city, obj.state) or (None, None)
+
+
+def geocode_all(missing_only=True, batch_size=1000):
+    # geocodes the venues without coordinates (or all); returns (venues
+    # looked up, venues located)
+    query = select(Venue.id, Venue.address, Venue.city, Venue.state).order_by(Venue.id)
+    if missing_only:
+        query = query.where(Venue.latitude.is_(None))
+    statement = Venue.__table__.update().where(Venue.__table__.c.id == bindparam('venue_id')).values(
+        latitude=bindparam('lat'), longitude=bindparam('lng'))
+    rows = db.session.execute(query).all()
+    located = 0
+    for start in range(0, len(rows), batch_size):
+        batch = []
+        for id, address, city, state in rows[start:start + batch_size]:
+            point = geocode(address, city, state)
+            located += point is not None
+            batch.append({'venue_id': id, 'lat': point and point[0], 'lng': point and point[1]})
+        db.session.execute(statement, batch)
+        db.session.commit()
+    backend = current_app.extensions.get('nearby')
+    if hasattr(backend, 'rebuild'):
+        backend.rebuild()
+    return len(rows), located
+
+
+#  Spatial backends
+#  ----------------------------------------------------------------
+
+def result_rows(ids):
+    rows = db.session.execute(select(
+        Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_count.label('num_upcoming_shows')
+    ).where(Venue.id.in_(ids)))
+    return {row.id: row for row in rows}
+
+
+def result(row, distance):
+    return {"id": row.id, "name": row.name, "city": row.city, "state": row.state,
+            "num_upcoming_shows": row.num_upcoming_shows, "distance": round(distance, 2)}
+
+
+class PostgresNearby(object):
+    # earth_box() @> is answered from the GiST index, earth_distance() then
+    # drops the corners of the box and orders the rest
+
+    def near(self, latitude, longitude, radius, limit=20):
+        origin = func.ll_to_earth(latitude, longitude)
+        point = func.ll_to_earth(Venue.latitude, Venue.longitude)
+        distance = func.earth_distance(origin, point)
+        meters = radius * METERS_PER_MILE
+        started = time.perf_counter()
+        rows = db.session.execute(
+            select(Venue.id, Venue.name, Venue.city, Venue.state,
+                   Venue.upcoming_count.label('num_upcoming_shows'), distance.label('distance'))
+            .where(func.earth_box(origin, meters).op('@>')(point), distance <= meters)
+            .order_by(distance, Venue.id).limit(limit)
+        ).all()
+        return {"index_ms": (time.perf_counter() - started) * 1000,
+                "data": [result(row, row.distance / METERS_PER_MILE) for row in rows]}
+
+
+def unit_vector(latitude, longitude):
+    # the point on the unit sphere; straight-line (chord) distances between
+    # these grow with the great-circle distance, so a KD-tree can search them
+    lat, lng = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lng), math.cos(lat) * math.sin(lng), math.sin(lat))
+
+
+class KDTree(object):
+    # a static 3-d tree over (point, id) pairs, split at the median of each
+    # axis in turn; nodes are (point, id, axis, left, right)
+
+    def __init__(self, points):
+        self.size = len(points)
+        self.root = self.build(list(points), 0)
+
+    def build(self, points, axis):
+        if not points:
+            return None
+        points.sort(key=lambda item: item[0][axis])
+        middle = len(points) // 2
+        point, id = points[middle]
+        following = (axis + 1) % 3
+        return (point, id, axis, self.build(points[:middle], following), self.build(points[middle + 1:], following))
+
+    def within(self, center, radius):
+        # [(squared chord distance, id)] of the points within radius of center
+        found = []
+        limit = radius * radius
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, id, axis, left, right = node
+            squared = (point[0] - center[0]) ** 2 + (point[1] - center[1]) ** 2 + (point[2] - center[2]) ** 2
+            if squared <= limit:
+                found.append((squared, id))
+            offset = center[axis] - point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            stack.append(near)
+            if offset * offset <= limit:
+                stack.append(far)
+        return found
+
+
+class MemoryNearby(object):
+    # venues written since the tree was built are kept aside and scanned,
+    # until there are REBUILD_AFTER of them
+
+    REBUILD_AFTER = 256
+
+    def __init__(self):
+        self.points = None
+        self.tree = None
+        self.recent = {}
+        self.lock = threading.Lock()
+
+    def index(self):
+        # (tree, recent points, all points), loading them on first use
+        with self.lock:
+            if self.points is None:
+                rows = db.session.execute(select(Venue.id, Venue.latitude, Venue.longitude).where(
+                    Venue.latitude.isnot(None), Venue.longitude.isnot(None)))
+                self.points = {id: unit_vector(lat, lng) for id, lat, lng in rows}
+                self.tree, self.recent = None, {}
+            if self.tree is None or len(self.recent) > self.REBUILD_AFTER:
+                self.tree, self.recent = KDTree([(point, id) for id, point in self.points.items()]), {}
+            return self.tree, dict(self.recent), self.points
+
+    def rebuild(self):
+        # drop the index after writes that bypass the session (bulk loads)
+        with self.lock:
+            self.points = None
+
+    def track(self, session, flush_context):
+        pending = session.info.setdefault('nearby_pending', [])
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, Venue):
+                located = obj.latitude is not None and obj.longitude is not None
+                pending.append((obj.id, unit_vector(obj.latitude, obj.longitude) if located else None))
+        for obj in session.deleted:
+            if isinstance(obj, Venue):
+                pending.append((obj.id, None))
+
+    def apply(self, session):
+        pending = session.info.pop('nearby_pending', [])
+        with self.lock:
+            if self.points is None:
+                return
+            for id, point in pending:
+                if point is None:
+                    self.points.pop(id, None)
+                    self.recent.pop(id, None)
+                else:
+                    self.points[id] = self.recent[id] = point
+
+    def discard(self, session):
+        session.info.pop('nearby_pending', None)
+
+    def near(self, latitude, longitude, radius, limit=20):
+        tree, recent, points = self.index()
+        started = time.perf_counter()
+        center = unit_vector(latitude, longitude)
+        chord = 2 * math.sin(min(radius / EARTH_RADIUS_MILES, math.pi) / 2)
+        found = {id: squared for squared, id in tree.within(center, chord)
+                 if id not in recent and points.get(id) is not None}
+        for id, point in recent.items():
+            squared = sum((point[axis] - center[axis]) ** 2 for axis in range(3))
+            if squared <= chord * chord:
+                found[id] = squared
+        nearest = sorted(found, key=lambda id: (found[id], id))[:limit]
+        index_ms = (time.perf_counter() - started) * 1000
+
+        rows = result_rows(nearest) if nearest else {}
+        data = []
+        for id in nearest:
+            if id in rows:
+                distance = 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(found[id]) / 2))
+                data.append(result(rows[id], distance))
+        return {"index_ms": index_ms, "data": data}
+
+
+def memory_backend():
+    backend = current_app.extensions.get('nearby') if has_app_context() else None
+    return backend if isinstance(backend, MemoryNearby) else None
+
+
+# Session listeners, registered once and handing the events to the app's
+# MemoryNearby
+def track(session, flush_context):
+    backend = memory_backend()
+    if backend is not None:
+        backend.track(session, flush_context)
+
+
+def apply(session):
+    backend = memory_backend()
+    if backend is not None:
+        backend.apply(session)
+
+
+def discard(session):
+    backend = memory_backend()
+    if backend is not None:
+        backend.discard(session)
+
+
+LISTENERS = (('before_flush', locate), ('after_flush', track), ('after_commit', apply),
+             ('after_rollback', discard))
+
+
+def init_app(app):
+    # GEOCODER is 'gazetteer', 'none' or the import path of a class taking
+    # the app; NEARBY_BACKEND picks 'postgresql' or 'memory' and by default
+    # follows the database
+    geocoder = app.config.get('GEOCODER', 'gazetteer')
+    factory = GEOCODERS.get(geocoder) or import_string(geocoder)
+    app.extensions['geocoder'] = factory(app)
+    name = app.config.get('NEARBY_BACKEND')
+    if not name:
+        name = 'postgresql' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'memory'
+    app.extensions['nearby'] = PostgresNearby() if name == 'postgresql' else MemoryNearby()
+    for identifier, listener in LISTENERS:
+        if not event.contains(Session, identifier, listener):
+            event.listen(Session, identifier, listener)
+    return app.extensions['nearby']
+
+
+def near(latitude, longitude, radius, limit=20):
+    return current_app.extensions['nearby'].near(latitude, longitude, radius, limit)
@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------#
+# gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The app is imported once in the master (preload_app) and forked into the
+# workers, which share its memory pages and start instantly. Every worker
+# then drops the connection pools it inherited, so no two processes ever
+# talk over the same socket. The worker model comes from WORKER_CLASS in
+# config.py: 'sync' (one request per process), 'gthread' (WORKER_THREADS
+# threads per process) or 'gevent' (WORKER_CONNECTIONS greenlets per
+# process; needs gevent, plus psycogreen and the psycopg2 driver for
+# PostgreSQL).
+# ----------------------------------------------------------------------------#
+
+import os
+# not `config`, which gunicorn would read as its own setting
+import config as settings
+
+bind = os.environ.get('BIND', '0.0.0.0:%s' % os.environ.get('PORT', '8000'))
+worker_class = settings.WORKER_CLASS
+workers = settings.WORKERS
+if worker_class == 'gthread':
+    threads = settings.WORKER_THREADS
+if worker_class == 'gevent':
+    worker_connections = settings.WORKER_CONNECTIONS
+
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then, staggered so they do not restart together
+max_requests = 5000
+max_requests_jitter = 500
+accesslog = os.environ.get('ACCESS_LOG')
+
+
+def when_ready(server):
+    # in the master, after the preloaded app is imported and before any
+    # worker is forked, so every worker starts with warm templates
+    if settings.WARMUP_ON_START:
+        from app import app
+        import templating
+        templating.warm(app)
+
+
+def make_green(server, engines):
+    # a gevent worker only serves its greenlets concurrently when the database
+    # driver yields to the hub while it waits. psycopg2 does once psycogreen
+    # has patched it; without psycogreen the worker refuses to boot. Other
+    # drivers (psycopg 3, the default for postgresql://) cannot be patched,
+    # so every query blocks the whole worker: warn about them.
+    drivers = {engine.dialect.driver for engine in engines} - {'pysqlite'}
+    if 'psycopg2' in drivers:
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            raise RuntimeError('gevent workers need psycogreen for psycopg2: pip install psycogreen')
+        patch_psycopg()
+        drivers.discard('psycopg2')
+    for driver in sorted(drivers):
+        server.log.warning('gevent workers: the %s driver is not patched for gevent and blocks the '
+                           'worker on every query; use postgresql+psycopg2:// with psycogreen, or '
+                           'WORKER_CLASS=gthread', driver)
+
+
+def post_fork(server, worker):
+    from app import app
+    from models import db
+    with app.app_context():
+        if worker_class == 'gevent':
+            make_green(server, db.engines.values())
+        for engine in db.engines.values():
+            # close=False leaves the parent's connections alone and just
+            # forgets them in this process
+            engine.dispose(close=False)
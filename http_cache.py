@@ -0,0 +1,97 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from flask import current_app, g, request, session
+from werkzeug.http import is_resource_modified
+from replicas import STICKY_COOKIE
+import cache
+
+# ----------------------------------------------------------------------------#
+# Conditional requests.
+#
+# Views marked @conditional(policy, kind, validator) answer a GET with a
+# strong ETag and Last-Modified computed from validator(**view_args) (the
+# updated_at columns, see queries.py), and a revalidation that matches gets
+# a 304 before the view runs, so nothing is loaded or rendered. The
+# validator is memoized under the page's cache generation like the view
+# data. Cache-Control comes from HTTP_CACHE_POLICIES[policy], so a reverse
+# proxy can serve and revalidate the pages. Responses carrying flashed
+# messages or read from the primary after a write are private. Views whose
+# body is compressed on the fly (the JSON API) pass weak=True: their gzip and
+# identity bodies differ byte for byte, so they only share a weak ETag.
+# ----------------------------------------------------------------------------#
+
+PRIVATE = 'private, no-cache'
+
+
+def conditional(policy, kind, validator, weak=False):
+    # @app.route(...) / @conditional('entity', 'venue', queries.venue_validator) / def view(): ...
+    def decorator(f):
+        f.conditional = (policy, kind, validator, weak)
+        return f
+    return decorator
+
+
+def as_utc(value):
+    # updated_at is naive local time
+    return value.astimezone(timezone.utc)
+
+
+def templates_digest(app):
+    # part of every ETag, so a deploy changing the templates or the built
+    # assets changes them
+    digest = hashlib.sha1(app.config.get('RELEASE', '').encode())
+    digest.update(json.dumps(app.extensions.get('assets', {}), sort_keys=True).encode())
+    for name in sorted(app.jinja_env.list_templates()):
+        digest.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode())
+    return digest.hexdigest()
+
+
+def etag_of(state):
+    parts = (current_app.extensions['http_cache'], request.endpoint,
+             sorted(request.args.items(multi=True)), state)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def init_app(app):
+    app.extensions['http_cache'] = templates_digest(app)
+    policies = app.config.get('HTTP_CACHE_POLICIES', {})
+
+    @app.before_request
+    def check_validator():
+        view = app.view_functions.get(request.endpoint)
+        spec = getattr(view, 'conditional', None)
+        if spec is None or request.method not in ('GET', 'HEAD'):
+            return None
+        if '_flashes' in session or request.cookies.get(STICKY_COOKIE):
+            g.cache_control = PRIVATE
+            return None
+        policy, kind, validator, weak = spec
+        args = request.view_args or {}
+        id = next(iter(args.values()), None)
+        state = cache.memoize(kind, id, ('validator',), lambda: validator(**args))
+        if state is None:
+            return None
+
+        times = [as_utc(value) for value in state if isinstance(value, datetime)]
+        g.conditional = (etag_of(state), max(times) if times else None, weak)
+        g.cache_control = policies.get(policy, PRIVATE)
+        if not is_resource_modified(request.environ, etag=g.conditional[0], last_modified=g.conditional[1]):
+            return app.response_class(status=304)
+        return None
+
+    @app.after_request
+    def add_validators(response):
+        if response.status_code in (200, 304):
+            if g.get('conditional'):
+                etag, last_modified, weak = g.conditional
+                response.set_etag(etag, weak)
+                if last_modified:
+                    response.last_modified = last_modified
+            if g.get('cache_control'):
+                response.headers['Cache-Control'] = g.cache_control
+        return response
@@ -0,0 +1,321 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import codecs
+import csv
+import json
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres, letter_of
+import booking
+import cache
+import exporter
+import geo
+import counters
+
+# ----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Streams CSV or NDJSON venues, artists or shows in fixed-size batches. Each
+# row is validated with the matching form; each batch resolves its genres and
+# foreign keys with one IN query per table, writes with executemany and
+# commits on its own, so a rejected row never costs the rest of the file.
+# Shows overlapping a booked show (or an earlier row) are rejected.
+# Used by `flask import` and POST /_internal/import/<kind>.
+# ----------------------------------------------------------------------------#
+
+FORMS = {'venues': VenueForm, 'artists': ArtistForm, 'shows': ShowForm}
+MODELS = {'venues': Venue, 'artists': Artist}
+# every column the exporter writes, so an export reads back in full
+COLUMNS = {
+    kind: tuple(column for column in exporter.EXPORTS[kind][1] if column not in exporter.DERIVED)
+    for kind in MODELS
+}
+BOOLEANS = {'true': True, '1': True, 'yes': True, 'false': False, '0': False, 'no': False}
+
+
+def parse_rows(stream, format):
+    # yields (line number, row dict) from a binary stream; a row's genres may
+    # be a list (NDJSON) or a comma separated string
+    text = codecs.getreader('utf-8-sig')(stream)
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {'_error': 'invalid JSON: %s' % e}
+        yield number, row if isinstance(row, dict) else {'_error': 'not a JSON object'}
+
+
+def format_of(filename):
+    return 'csv' if filename.lower().endswith('.csv') else 'ndjson'
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def form_data(row):
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'genres' and isinstance(value, str):
+            value = [name.strip() for name in value.split(',') if name.strip()]
+        if isinstance(value, list):
+            data.setlist(key, [str(item) for item in value])
+        elif value is not None:
+            data[key] = str(value)
+    return data
+
+
+def column_values(kind, row, form):
+    # the columns the form has no field for (website, seeking_*, the
+    # coordinates), parsed by their column type; empty cells are left out
+    values, errors = {}, {}
+    for column in COLUMNS.get(kind, ()):
+        value = row.get(column)
+        if column in form or value is None or value == '':
+            continue
+        python_type = MODELS[kind].__table__.c[column].type.python_type
+        try:
+            if python_type is bool:
+                value = value if isinstance(value, bool) else BOOLEANS[str(value).strip().lower()]
+            else:
+                value = python_type(value)
+        except (KeyError, TypeError, ValueError):
+            errors[column] = ['not a valid %s' % python_type.__name__]
+            continue
+        values[column] = value
+    return values, errors
+
+
+def validate(kind, batch):
+    # the rows passing the form rules as (line, form.data), the others as
+    # (line, errors); one form instance is reused for the whole batch
+    form = FORMS[kind](meta={'csrf': False})
+    valid, rejected = [], []
+    for line, row in batch:
+        if '_error' in row:
+            rejected.append((line, {'row': [row['_error']]}))
+            continue
+        form.process(form_data(row))
+        values, errors = column_values(kind, row, form)
+        if form.validate() and not errors:
+            data = dict(form.data, **values)
+            for key in ('venue_name', 'artist_name'):
+                if row.get(key):
+                    data[key] = str(row[key]).strip()
+            valid.append((line, data))
+        else:
+            rejected.append((line, dict(form.errors, **errors)))
+    return valid, rejected
+
+
+def genre_ids(names):
+    # name -> Genre.id, inserting the missing genres in one statement
+    names = set(names)
+    ids = dict(db.session.execute(select(Genre.name, Genre.id).where(Genre.name.in_(names))).all())
+    missing = [{'name': name} for name in sorted(names - set(ids))]
+    if missing:
+        db.session.execute(insert(Genre), missing)
+        ids.update(db.session.execute(
+            select(Genre.name, Genre.id).where(Genre.name.in_([row['name'] for row in missing]))
+        ).all())
+    return ids
+
+
+def load_entities(kind, valid, rejected):
+    model = MODELS[kind]
+    links, key = (venue_genres, 'venue_id') if kind == 'venues' else (artist_genres, 'artist_id')
+    # Venue.name and Artist.name are unique: reject the names already taken,
+    # or repeated in the batch, up front instead of failing the whole batch
+    # on the constraint
+    names = [data['name'] for _, data in valid]
+    taken = set(db.session.scalars(select(model.name).where(model.name.in_(names))))
+    unique = []
+    for line, data in valid:
+        if data['name'] in taken:
+            rejected.append((line, {'name': ['%s named %s already exists' % (
+                'a venue' if kind == 'venues' else 'an artist', data['name'])]}))
+            continue
+        taken.add(data['name'])
+        unique.append((line, data))
+    valid = unique
+    if not valid:
+        return 0
+
+    table = model.__table__
+    # executemany needs the same keys in every row: the missing columns take
+    # their defaults
+    defaults = {column.name: column.default.arg for column in table.c
+                if column.default is not None and column.default.is_scalar}
+    rows = [{column: data.get(column, defaults.get(column)) for column in COLUMNS[kind]} for _, data in valid]
+    if kind == 'venues':
+        # the session's geocoding hook does not see Core inserts; exported
+        # coordinates are kept
+        for row in rows:
+            if row['latitude'] is None or row['longitude'] is None:
+                row['latitude'], row['longitude'] = \
+                    geo.geocode(row['address'], row['city'], row['state']) or (None, None)
+    ids = db.session.scalars(
+        insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+    ).all()
+    genres = genre_ids(name for _, data in valid for name in data['genres'])
+    link_rows = [
+        {key: id, 'genre_id': genres[name]}
+        for id, (_, data) in zip(ids, valid) for name in set(data['genres'])
+    ]
+    if link_rows:
+        db.session.execute(insert(links), link_rows)
+    if kind == 'artists':
+        counters.artists_added(letter_of(row['name']) for row in rows)
+    return len(ids)
+
+
+def resolve(model, valid, rejected, id_key, name_key):
+    # fills data[id_key] from the id or the (unique) name given in the row,
+    # with one query for the ids and one for the names
+    ids = {int(data[id_key]) for _, data in valid if str(data.get(id_key) or '').isdigit()}
+    names = {data[name_key] for _, data in valid if data.get(name_key)}
+    known = set(db.session.scalars(select(model.id).where(model.id.in_(ids)))) if ids else set()
+    by_name = {}
+    if names:
+        for id, name in db.session.execute(select(model.id, model.name).where(model.name.in_(names))):
+            by_name[name] = None if name in by_name else id
+    resolved = []
+    for line, data in valid:
+        value = str(data.get(id_key) or '')
+        if value.isdigit() and int(value) in known:
+            data[id_key] = int(value)
+        elif not value and by_name.get(data.get(name_key)):
+            data[id_key] = by_name[data[name_key]]
+        else:
+            label = value or data.get(name_key) or 'missing'
+            rejected.append((line, {id_key: ['no single %s matches %s' % (model.__tablename__, label)]}))
+            continue
+        resolved.append((line, data))
+    return resolved
+
+
+def load_shows(valid, rejected, now, touched):
+    valid = resolve(Venue, valid, rejected, 'venue_id', 'venue_name')
+    valid = resolve(Artist, valid, rejected, 'artist_id', 'artist_name')
+    rows = []
+    for line, data in valid:
+        try:
+            start_time, end_time = booking.span(data['start_time'], data.get('end_time'))
+        except booking.BookingError as e:
+            rejected.append((line, {'end_time': [str(e)]}))
+            continue
+        rows.append({'line': line, 'venue_id': data['venue_id'], 'artist_id': data['artist_id'],
+                     'start_time': start_time, 'end_time': end_time})
+    rows, overlapping = booking.check_batch(rows)
+    rejected.extend((row['line'], {'start_time': [reason]}) for row, reason in overlapping)
+    if not rows:
+        return 0
+    venue_ids = {row['venue_id'] for row in rows}
+    artist_ids = {row['artist_id'] for row in rows}
+    db.session.execute(insert(Show), [
+        {'venue_id': row['venue_id'], 'artist_id': row['artist_id'],
+         'start_time': row['start_time'], 'end_time': row['end_time']}
+        for row in rows
+    ])
+    # recount only the venues and artists the batch touched
+    counters.recount(Venue, now, stale_only=False, ids=venue_ids)
+    counters.recount(Artist, now, stale_only=False, ids=artist_ids)
+    touched.update(('venue', id) for id in venue_ids)
+    touched.update(('artist', id) for id in artist_ids)
+    touched.update(('month', row['start_time'].strftime('%Y-%m')) for row in rows)
+    return len(rows)
+
+
+class Report(object):
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.batches = []
+        self.rejected = []
+
+    @property
+    def imported(self):
+        return sum(batch['imported'] for batch in self.batches)
+
+    def as_dict(self):
+        seconds = sum(batch['seconds'] for batch in self.batches)
+        return {
+            'kind': self.kind,
+            'imported': self.imported,
+            'rejected': [{'line': line, 'errors': errors} for line, errors in self.rejected],
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.imported / seconds, 1) if seconds else 0.0,
+            'batches': self.batches
+        }
+
+
+def run(kind, stream, format='ndjson', batch_size=5000, progress=None):
+    # imports kind ('venues', 'artists' or 'shows') from stream; progress is
+    # called with each batch's stats as it is committed. A batch failing on
+    # the database is rolled back and its rows reported as rejected; the
+    # batches committed before (and after) it stay in.
+    report = Report(kind)
+    touched = set()
+    try:
+        for number, batch in enumerate(batches(parse_rows(stream, format), batch_size), 1):
+            started = time.perf_counter()
+            valid, rejected = validate(kind, batch)
+            try:
+                if kind == 'shows':
+                    batch_touched = set()
+                    imported = load_shows(valid, rejected, datetime.now(), batch_touched)
+                else:
+                    imported = load_entities(kind, valid, rejected)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.exception('import of %s batch %d failed', kind, number)
+                imported, lines = 0, {line for line, _ in rejected}
+                rejected.extend((line, {'batch': ['batch %d failed: %s' % (number, e)]})
+                                for line, _ in batch if line not in lines)
+            else:
+                if kind == 'shows':
+                    touched.update(batch_touched)
+            seconds = time.perf_counter() - started
+            stats = {
+                'batch': number,
+                'rows': len(batch),
+                'imported': imported,
+                'rejected': len(rejected),
+                'seconds': round(seconds, 3),
+                'rows_per_second': round(len(batch) / seconds, 1) if seconds else 0.0
+            }
+            report.batches.append(stats)
+            report.rejected.extend(sorted(rejected, key=lambda rejection: rejection[0]))
+            if progress:
+                progress(stats)
+    finally:
+        if report.imported:
+            # the committed rows went in behind the session's back, even when
+            # a later batch (or reading the stream) raised
+            for name in ('search', 'nearby'):
+                backend = current_app.extensions.get(name)
+                if hasattr(backend, 'rebuild'):
+                    backend.rebuild()
+            cache.invalidate(('venues', None), ('artists', None), ('shows', None), *touched)
+    return report
@@ -0,0 +1,68 @@
+"""add Show.end_time and the booking constraints
+
+Revision ID: e5b1d8f3a6c4
+Revises: c3e8b5a1f7d2
+Create Date: 2026-10-18 23:14:52.208361
+
+"""
+from datetime import timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1d8f3a6c4'
+down_revision = 'c3e8b5a1f7d2'
+branch_labels = None
+depends_on = None
+
+# models.SHOW_LENGTH as of this revision
+SHOW_LENGTH = timedelta(hours=2)
+
+OVERLAPS = """
+    SELECT a.id, b.id FROM "Show" a JOIN "Show" b
+      ON a.id < b.id AND (a.{0} = b.{0})
+     AND tsrange(a.start_time, a.end_time) && tsrange(b.start_time, b.end_time)
+    LIMIT 20
+"""
+
+
+def upgrade():
+    connection = op.get_bind()
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    show = sa.table('Show', sa.column('id', sa.Integer), sa.column('start_time', sa.DateTime),
+                    sa.column('end_time', sa.DateTime))
+    if connection.dialect.name == 'postgresql':
+        op.execute('UPDATE "Show" SET end_time = start_time + interval \'2 hours\'')
+    else:
+        rows = connection.execute(sa.select(show.c.id, show.c.start_time)).all()
+        if rows:
+            connection.execute(
+                show.update().where(show.c.id == sa.bindparam('show_id')).values(end_time=sa.bindparam('end')),
+                [{'show_id': id, 'end': start_time + SHOW_LENGTH} for id, start_time in rows]
+            )
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_check_constraint('ck_Show_end_time', 'end_time > start_time')
+
+    if connection.dialect.name != 'postgresql':
+        return
+    # the constraints cannot be added over shows booked twice already
+    for key in ('venue_id', 'artist_id'):
+        pairs = connection.execute(sa.text(OVERLAPS.format(key))).all()
+        if pairs:
+            raise RuntimeError('shows overlapping on %s, reschedule them first: %s' % (
+                key, ', '.join('%d/%d' % pair for pair in pairs)))
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for key in ('venue_id', 'artist_id'):
+        op.create_exclude_constraint('ex_Show_%s_during' % key, 'Show', (key, '='),
+                                     (sa.text('tsrange(start_time, end_time)'), '&&'), using='gist')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('ex_Show_artist_id_during', 'Show')
+        op.drop_constraint('ex_Show_venue_id_during', 'Show')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_constraint('ck_Show_end_time', type_='check')
+        batch_op.drop_column('end_time')
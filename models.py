@@ -0,0 +1,202 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import unicodedata
+from datetime import datetime, timedelta
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.orm import validates
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# ----------------------------------------------------------------------------#
+# Models.
+# ----------------------------------------------------------------------------#
+venue_genres = db.Table(
+    'venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    # genre -> venues lookups for the ?genre= filters
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table(
+    'artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
+
+def letter_of(name):
+    # the A-Z index letter of a name ('Émile' -> 'E'), '#' for the rest
+    first = unicodedata.normalize('NFKD', (name or '').strip()[:1])[:1].upper()[:1]
+    return first if 'A' <= first <= 'Z' else '#'
+
+
+def name_letter(context):
+    # Artist.letter for Core inserts (the importer)
+    return letter_of(context.get_current_parameters().get('name'))
+
+
+# a show without an end time runs SHOW_LENGTH; none may run longer than
+# SHOW_MAX_LENGTH, which bounds the overlap lookups of booking.py
+SHOW_LENGTH = timedelta(hours=2)
+SHOW_MAX_LENGTH = timedelta(hours=24)
+
+
+def show_end(context):
+    # Show.end_time when none is given
+    return context.get_current_parameters()['start_time'] + SHOW_LENGTH
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def named(cls, names):
+        # the Genre rows for names, creating the missing ones in the session
+        names = sorted({name.strip() for name in names if name and name.strip()})
+        if not names:
+            return []
+        genres = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))}
+        for name in names:
+            if name not in genres:
+                genres[name] = cls(name=name)
+                db.session.add(genres[name])
+        return [genres[name] for name in names]
+
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        db.Index('ix_Venue_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False, unique=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    address = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(120), nullable=False)
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120), nullable=False)
+    website = db.Column(db.String())
+    seeking_talent = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(), default='')
+    # geocoded from address, city and state (see geo.py)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    upcoming_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now(), index=True)
+
+    shows = db.relationship('Show', backref="venue", lazy=True)
+    genres = db.relationship('Genre', secondary=venue_genres, lazy=True, order_by='Genre.name')
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate -->
+
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # the paginated listing, in (letter, name, id) order
+        db.Index('ix_Artist_letter_name_id', 'letter', 'name', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, unique=True)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String())
+    seeking_venue = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(), default="")
+    upcoming_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now(), index=True)
+
+    # first letter of name, kept in step by the validator below
+    letter = db.Column(db.String(1), nullable=False, default=name_letter, server_default='#')
+
+    shows = db.relationship('Show', backref="artist", lazy=True)
+    genres = db.relationship('Genre', secondary=artist_genres, lazy=True, order_by='Genre.name')
+
+    @validates('name')
+    def validate_name(self, key, name):
+        self.letter = letter_of(name)
+        return name
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate --> ???
+
+
+class ArtistLetter(db.Model):
+    # artists per index letter, for the A-Z bar of /artists (see counters.py)
+    __tablename__ = 'ArtistLetter'
+
+    letter = db.Column(db.String(1), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+class Show(db.Model):
+    __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.CheckConstraint('end_time > start_time', name='ck_Show_end_time'),
+        # no venue or artist is booked twice at once (PostgreSQL; booking.py
+        # checks the other databases)
+        ExcludeConstraint(('venue_id', '='), (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+                          name='ex_Show_venue_id_during', using='gist').ddl_if(dialect='postgresql'),
+        ExcludeConstraint(('artist_id', '='), (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+                          name='ex_Show_artist_id_during', using='gist').ddl_if(dialect='postgresql'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
+    end_time = db.Column(db.DateTime, nullable=False, default=show_end)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now(), index=True)
+
+
+# /venues/near on PostgreSQL: earth_box() searches of this GiST index
+db.Index('ix_Venue_earth', db.func.ll_to_earth(Venue.latitude, Venue.longitude),
+         postgresql_using='gist').ddl_if(dialect='postgresql')
+
+# the trigram indexes need pg_trgm, the Show exclusion constraints
+# btree_gist and ix_Venue_earth earthdistance (which needs cube) before the
+# first table is created
+event.listen(
+    db.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+event.listen(
+    db.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
+event.listen(
+    db.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS cube').execute_if(dialect='postgresql')
+)
+event.listen(
+    db.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS earthdistance').execute_if(dialect='postgresql')
+)
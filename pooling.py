@@ -0,0 +1,153 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import threading
+import time
+from collections import deque
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool, NullPool
+
+# ----------------------------------------------------------------------------#
+# Connection pool.
+#
+# engine_options() turns the DB_POOL_* settings into SQLALCHEMY_ENGINE_OPTIONS
+# with an instrumented pool class, whose stats (checkout wait, connections in
+# use, overflow connections opened, timeouts) are served on /_internal/pool.
+# ----------------------------------------------------------------------------#
+
+
+class PoolStats(object):
+
+    def __init__(self, samples=1000):
+        self.lock = threading.Lock()
+        self.waits = deque(maxlen=samples)
+        self.checkouts = 0
+        self.checkins = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.overflow_connections = 0
+        self.timeouts = 0
+        self.connects = 0
+
+    def checked_out(self, wait, opened_overflow):
+        with self.lock:
+            self.waits.append(wait)
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if opened_overflow:
+                self.overflow_connections += 1
+
+    def checked_in(self):
+        with self.lock:
+            self.checkins += 1
+            self.in_use = max(0, self.in_use - 1)
+
+    def as_dict(self):
+        with self.lock:
+            waits = sorted(self.waits)
+            data = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'overflow_connections': self.overflow_connections,
+                'timeouts': self.timeouts,
+                'connects': self.connects
+            }
+        for name, quantile in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            data['checkout_wait_%s_ms' % name] = \
+                waits[min(len(waits) - 1, int(len(waits) * quantile))] * 1000 if waits else 0.0
+        data['checkout_wait_max_ms'] = waits[-1] * 1000 if waits else 0.0
+        return data
+
+
+class InstrumentedPool(object):
+    # mixed in front of a SQLAlchemy pool class to time every checkout
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedPool, self).__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        overflow = self.overflow_level()
+        started = time.perf_counter()
+        try:
+            connection = super(InstrumentedPool, self)._do_get()
+        except TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.checked_out(time.perf_counter() - started, self.overflow_level() > max(0, overflow))
+        return connection
+
+    def _do_return_conn(self, record):
+        self.stats.checked_in()
+        super(InstrumentedPool, self)._do_return_conn(record)
+
+    def _create_connection(self):
+        self.stats.connects += 1
+        return super(InstrumentedPool, self)._create_connection()
+
+    def overflow_level(self):
+        return 0
+
+
+class InstrumentedQueuePool(InstrumentedPool, QueuePool):
+
+    def overflow_level(self):
+        return self.overflow()
+
+
+class InstrumentedNullPool(InstrumentedPool, NullPool):
+    pass
+
+
+def engine_options(config, uri=None):
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('sqlite') and (uri in ('sqlite://', 'sqlite:///') or ':memory:' in uri):
+        # in-memory SQLite keeps its single-connection pool
+        return options
+    options['pool_pre_ping'] = config.get('DB_POOL_PRE_PING', True)
+    if config.get('DB_NULL_POOL'):
+        options['poolclass'] = InstrumentedNullPool
+        return options
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', -1)
+    })
+    return options
+
+
+def replica_binds(config):
+    # one replica_<n> bind per SQLALCHEMY_REPLICA_URIS entry, pooled like the primary
+    return {
+        'replica_%d' % i: dict(engine_options(config, uri), url=uri)
+        for i, uri in enumerate(config.get('SQLALCHEMY_REPLICA_URIS') or ())
+    }
+
+
+def init_app(app):
+    # call before db.init_app(app) so the engines are built with these options
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **replica_binds(app.config))
+
+
+def stats(engine):
+    pool = engine.pool
+    data = {'pool': type(pool).__name__, 'status': pool.status()}
+    if isinstance(pool, QueuePool):
+        data.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow()
+        })
+    if isinstance(pool, InstrumentedPool):
+        data.update(pool.stats.as_dict())
+    return data
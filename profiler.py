@@ -0,0 +1,131 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import json
+import re
+import time
+from collections import Counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from models import db
+
+# ----------------------------------------------------------------------------#
+# SQL profiler.
+#
+# Opt-in (SQL_PROFILER = True). Times every statement a request runs, adds a
+# Server-Timing header, logs one JSON line per request through app.logger and
+# flags N+1 patterns: the same normalized SELECT run more than
+# SQL_PROFILER_N_PLUS_ONE times. Views may declare a query budget with
+# @query_budget(n); going over it raises QueryBudgetExceeded when
+# SQL_QUERY_BUDGET_STRICT is set (the default under TESTING) and is logged
+# otherwise.
+# ----------------------------------------------------------------------------#
+
+IN_LIST = re.compile(r'\((?:\s*(?:\?|%\([^)]*\)s|%s|:\w+)\s*,)+\s*(?:\?|%\([^)]*\)s|%s|:\w+)\s*\)')
+NUMBER = re.compile(r'\b\d+\b')
+WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def normalize(statement):
+    statement = WHITESPACE.sub(' ', statement).strip()
+    statement = IN_LIST.sub('(?)', statement)
+    return NUMBER.sub('?', statement)
+
+
+def query_budget(limit):
+    # @app.route(...) / @query_budget(3) / def view(): ...
+    def decorator(f):
+        f.query_budget = limit
+        return f
+    return decorator
+
+
+class Profile(object):
+
+    def __init__(self):
+        self.statements = Counter()
+        self.count = 0
+        self.duration = 0.0
+
+    def record(self, statement, duration):
+        self.statements[normalize(statement)] += 1
+        self.count += 1
+        self.duration += duration
+
+    def duplicates(self):
+        return {statement: n for statement, n in self.statements.items() if n > 1}
+
+    def n_plus_one(self, threshold):
+        return [
+            statement for statement, n in self.statements.items()
+            if n > threshold and statement.upper().startswith('SELECT')
+        ]
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['profiler_started'].pop()
+    profile = g.get('sql_profile') if has_request_context() else None
+    if profile is not None:
+        profile.record(statement, time.perf_counter() - started)
+
+
+def init_app(app):
+    if not app.config.get('SQL_PROFILER'):
+        return
+    app.config.setdefault('SQL_QUERY_BUDGET_STRICT', app.testing)
+    with app.app_context():
+        # the primary and any replica binds
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        g.sql_profile = Profile()
+
+    @app.after_request
+    def report_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+        threshold = app.config.get('SQL_PROFILER_N_PLUS_ONE', 5)
+        n_plus_one = profile.n_plus_one(threshold)
+        view = app.view_functions.get(request.endpoint)
+        # g.query_budget: the budget of an async view serving the endpoint
+        budget = g.get('query_budget', getattr(view, 'query_budget', None))
+        over_budget = budget is not None and profile.count > budget
+
+        response.headers.add(
+            'Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (profile.duration * 1000, profile.count)
+        )
+        line = json.dumps({
+            'event': 'sql_profile',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'queries': profile.count,
+            'db_ms': round(profile.duration * 1000, 2),
+            'budget': budget,
+            'duplicates': profile.duplicates(),
+            'n_plus_one': n_plus_one
+        }, sort_keys=True)
+        if n_plus_one or over_budget:
+            app.logger.warning(line)
+        else:
+            app.logger.info(line)
+
+        if over_budget and app.config['SQL_QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded(
+                '%s ran %d queries, budget is %d' % (request.endpoint, profile.count, budget)
+            )
+        return response
@@ -0,0 +1,506 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import calendar
+from datetime import datetime, date, timedelta
+import dateutil.parser
+from itertools import groupby
+from flask import current_app
+from sqlalchemy import select, func, and_, or_, case
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.sql.functions import FunctionElement
+from models import db, Venue, Artist, Show, Genre, ArtistLetter, venue_genres, artist_genres, letter_of
+from formatting import format_datetimes
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+#  Shows
+#  ----------------------------------------------------------------
+
+def split_shows(shows, now):
+    # past shows newest first, upcoming shows soonest first
+    past, upcoming = [], []
+    for show in sorted(shows, key=lambda show: show.start_time):
+        if show.start_time < now:
+            past.append(show)
+        else:
+            upcoming.append(show)
+    past.reverse()
+    return past, upcoming
+
+
+def with_start_texts(shows, format='full'):
+    # adds the formatted start_time of each show dict as start_time_text, in
+    # one format_datetimes call per list; the text is cached with the data
+    for show, text in zip(shows, format_datetimes([show['start_time'] for show in shows], format)):
+        show['start_time_text'] = text
+    return shows
+
+
+def encode_cursor(start_time, show_id):
+    return '%s_%d' % (start_time.isoformat(), show_id)
+
+
+def decode_cursor(cursor):
+    # inverse of encode_cursor; raises ValueError on a malformed cursor
+    start_time, _, show_id = cursor.rpartition('_')
+    return dateutil.parser.isoparse(start_time), int(show_id)
+
+
+def shows_page_statement(after, start, end, per_page):
+    # one page of the /shows listing, seeking past the (start_time, id) cursor
+    # instead of using OFFSET so every page costs the same; selects one extra
+    # row to tell whether there is a next page.
+    query = select(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+
+    if start:
+        query = query.filter(Show.start_time >= start)
+    if end:
+        query = query.filter(Show.start_time < end)
+    if after:
+        start_time, show_id = decode_cursor(after)
+        query = query.filter(or_(
+            Show.start_time > start_time,
+            and_(Show.start_time == start_time, Show.id > show_id)
+        ))
+
+    return query.order_by(Show.start_time, Show.id).limit(per_page + 1)
+
+
+def shows_page_result(rows, per_page):
+    # (shows, next cursor) from the rows of shows_page_statement
+    shows = [
+        {
+            "venue_id": row.venue_id,
+            "venue_name": row.venue_name,
+            "artist_id": row.artist_id,
+            "artist_name": row.artist_name,
+            "artist_image_link": row.artist_image_link,
+            "start_time": row.start_time
+        }
+        for row in rows[:per_page]
+    ]
+    with_start_texts(shows)
+    next_cursor = None
+    if len(rows) > per_page:
+        last = rows[per_page - 1]
+        next_cursor = encode_cursor(last.start_time, last.id)
+    return shows, next_cursor
+
+
+def shows_page(after=None, start=None, end=None, per_page=None):
+    per_page = per_page or current_app.config.get('SHOWS_PER_PAGE', 30)
+    rows = db.session.execute(shows_page_statement(after, start, end, per_page)).all()
+    return shows_page_result(rows, per_page)
+
+
+def page_of(items, page, per_page):
+    # returns (items on the page, number of pages); per_page of 0/None lists everything
+    if not per_page:
+        return items, 1
+    pages = max(1, -(-len(items) // per_page))
+    page = min(max(1, page), pages)
+    start = (page - 1) * per_page
+    return items[start:start + per_page], pages
+
+
+def add_show_pages(data, past, upcoming, past_page, upcoming_page, row):
+    # fills the past/upcoming lists, counts and paging info of a detail page
+    config = current_app.config
+    past_items, past_pages = page_of(past, past_page, config.get('PAST_SHOWS_PER_PAGE'))
+    upcoming_items, upcoming_pages = page_of(upcoming, upcoming_page, config.get('UPCOMING_SHOWS_PER_PAGE'))
+    data.update({
+        "past_shows": with_start_texts([row(show) for show in past_items]),
+        "upcoming_shows": with_start_texts([row(show) for show in upcoming_items]),
+        "past_shows_count": len(past),
+        "upcoming_shows_count": len(upcoming),
+        "past_page": min(max(1, past_page), past_pages),
+        "past_pages": past_pages,
+        "upcoming_page": min(max(1, upcoming_page), upcoming_pages),
+        "upcoming_pages": upcoming_pages
+    })
+    return data
+
+
+#  Genres
+#  ----------------------------------------------------------------
+
+def with_genre(query, model, genre):
+    # narrows query to the model rows tagged genre through the
+    # (genre_id, owner id) index of the association table
+    if not genre:
+        return query
+    links, key = (venue_genres, venue_genres.c.venue_id) if model is Venue \
+        else (artist_genres, artist_genres.c.artist_id)
+    return query.join(links, key == model.id) \
+        .join(Genre, Genre.id == links.c.genre_id) \
+        .filter(Genre.name == genre)
+
+
+def genre_names(owner):
+    return [genre.name for genre in owner.genres]
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+def venue_areas_statement(genre=None):
+    statement = select(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_count.label('num_upcoming_shows')
+    )
+    return with_genre(statement, Venue, genre).order_by(Venue.state, Venue.city, Venue.id)
+
+
+def group_areas(rows):
+    # the city/state -> venues -> upcoming count tree rendered by venues.html,
+    # grouped from the ordered rows in one pass
+    areas = []
+    for (state, city), venues in groupby(rows, key=lambda row: (row.state, row.city)):
+        areas.append({
+            "city": city,
+            "state": state,
+            "venues": [
+                {
+                    "id": venue.id,
+                    "name": venue.name,
+                    "num_upcoming_shows": venue.num_upcoming_shows
+                }
+                for venue in venues
+            ]
+        })
+    return areas
+
+
+def venue_areas(genre=None):
+    return group_areas(db.session.execute(venue_areas_statement(genre)))
+
+
+def venue_show_row(show):
+    return {
+        "artist_id": show.artist.id,
+        "artist_name": show.artist.name,
+        "artist_image_link": show.artist.image_link,
+        "start_time": show.start_time
+    }
+
+
+def venue_detail_statement(venue_id):
+    # the venue with its shows and their artists in one joined query, then
+    # its genres in a second one
+    return select(Venue).options(joinedload(Venue.shows).joinedload(Show.artist),
+                                 selectinload(Venue.genres)).where(Venue.id == venue_id)
+
+
+def venue_detail(venue_id, past_page=1, upcoming_page=1, now=None):
+    now = now or datetime.now()
+    venue = db.session.execute(venue_detail_statement(venue_id)).unique().scalar_one_or_none()
+    if not venue:
+        return None
+
+    data = venue_data(venue, genre_names(venue))
+    past, upcoming = split_shows(venue.shows, now)
+    return add_show_pages(data, past, upcoming, past_page, upcoming_page, venue_show_row)
+
+
+def venue_data(venue, genres):
+    # the fields of the venue page; venue may be a model or a row
+    return {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": genres,
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link
+    }
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+LETTERS = '#ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def encode_artist_cursor(name, artist_id):
+    return '%s_%d' % (name, artist_id)
+
+
+def decode_artist_cursor(cursor):
+    # inverse of encode_artist_cursor; raises ValueError on a malformed cursor
+    name, _, artist_id = cursor.rpartition('_')
+    return name, int(artist_id)
+
+
+def artist_page_statement(genre=None, letter=None, after=None, per_page=60):
+    # one page of /artists in (letter, name, id) order, seeking past the
+    # cursor, or from the first artist filed under letter, along the
+    # ix_Artist_letter_name_id index; one extra row tells whether there is
+    # a next page
+    statement = with_genre(select(Artist.id, Artist.name, Artist.letter), Artist, genre)
+    if after:
+        name, artist_id = decode_artist_cursor(after)
+        after_letter = letter_of(name)
+        statement = statement.where(or_(
+            Artist.letter > after_letter,
+            and_(Artist.letter == after_letter, or_(
+                Artist.name > name,
+                and_(Artist.name == name, Artist.id > artist_id)
+            ))
+        ))
+    elif letter:
+        statement = statement.where(Artist.letter >= letter)
+    return statement.order_by(Artist.letter, Artist.name, Artist.id).limit(per_page + 1)
+
+
+def letter_counts_statement(genre=None):
+    # artists per letter: the precomputed ArtistLetter table, counted over
+    # the genre's artists only when filtering
+    if not genre:
+        return select(ArtistLetter.letter, ArtistLetter.count)
+    return with_genre(select(Artist.letter, func.count(Artist.id).label('count')), Artist, genre) \
+        .group_by(Artist.letter)
+
+
+def artist_page_data(rows, letter_rows, per_page):
+    # the /artists page from the rows of artist_page_statement and
+    # letter_counts_statement
+    counts = {row.letter: row.count for row in letter_rows}
+    next_cursor = None
+    if len(rows) > per_page:
+        last = rows[per_page - 1]
+        next_cursor = encode_artist_cursor(last.name, last.id)
+    return {
+        "artists": [{"id": row.id, "name": row.name, "letter": row.letter} for row in rows[:per_page]],
+        "next_cursor": next_cursor,
+        "letters": [{"letter": letter, "count": counts.get(letter, 0)} for letter in LETTERS]
+    }
+
+
+def artist_page(genre=None, letter=None, after=None, per_page=None):
+    per_page = per_page or current_app.config.get('ARTISTS_PER_PAGE', 60)
+    rows = db.session.execute(artist_page_statement(genre, letter, after, per_page)).all()
+    letter_rows = db.session.execute(letter_counts_statement(genre)).all()
+    return artist_page_data(rows, letter_rows, per_page)
+
+
+def artist_show_row(show):
+    return {
+        "venue_id": show.venue.id,
+        "venue_name": show.venue.name,
+        "venue_image_link": show.venue.image_link,
+        "start_time": show.start_time
+    }
+
+
+def artist_detail_statement(artist_id):
+    # the artist with its shows and their venues in one joined query, then
+    # its genres in a second one
+    return select(Artist).options(joinedload(Artist.shows).joinedload(Show.venue),
+                                  selectinload(Artist.genres)).where(Artist.id == artist_id)
+
+
+def artist_detail(artist_id, past_page=1, upcoming_page=1, now=None):
+    now = now or datetime.now()
+    artist = db.session.execute(artist_detail_statement(artist_id)).unique().scalar_one_or_none()
+    if not artist:
+        return None
+
+    data = artist_data(artist, genre_names(artist))
+    past, upcoming = split_shows(artist.shows, now)
+    return add_show_pages(data, past, upcoming, past_page, upcoming_page, artist_show_row)
+
+
+def artist_data(artist, genres):
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": genres,
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "image_link": artist.image_link
+    }
+
+
+#  Calendar
+#  ----------------------------------------------------------------
+#  Month grids, weeks starting on Sunday. Both queries scan one month of
+#  an index on start_time; a show is filed under the day it starts.
+
+class day_of(FunctionElement):
+    # the day a timestamp falls on, for GROUP BY; date_trunc('day', ...) on
+    # PostgreSQL, date(...) on SQLite
+    inherit_cache = True
+
+
+@compiles(day_of)
+def compile_day_of(element, compiler, **kw):
+    return "date_trunc('day', %s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_of, 'sqlite')
+def compile_day_of_sqlite(element, compiler, **kw):
+    return 'date(%s)' % compiler.process(element.clauses, **kw)
+
+
+def month_grid(start, days):
+    # the weeks of the month starting at start; days maps 'YYYY-MM-DD' to
+    # the dict of the day, merged into its cell
+    weeks = []
+    for week in calendar.Calendar(calendar.SUNDAY).monthdatescalendar(start.year, start.month):
+        weeks.append([
+            dict({'date': day.isoformat(), 'until': (day + timedelta(days=1)).isoformat(), 'day': day.day,
+                  'in_month': day.month == start.month, 'count': 0}, **days.get(day.isoformat(), {}))
+            for day in week
+        ])
+    return weeks
+
+
+def month_links(start):
+    previous = (date(start.year, start.month, 1) - date.resolution).replace(day=1)
+    following = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return {'month': start.strftime('%Y-%m'), 'title': start.strftime('%B %Y'),
+            'previous': previous.strftime('%Y-%m'), 'next': following.strftime('%Y-%m')}
+
+
+def calendar_counts_statement(start, end):
+    # shows per day in [start, end), one GROUP BY
+    day = day_of(Show.start_time)
+    return select(day.label('day'), func.count(Show.id).label('count')) \
+        .where(Show.start_time >= start, Show.start_time < end).group_by(day)
+
+
+def calendar_counts_data(rows, start):
+    # str() gives 'YYYY-MM-DD...' for PostgreSQL's timestamps and SQLite's dates
+    days = {str(row.day)[:10]: {'count': row.count} for row in rows}
+    return dict(month_links(start), total=sum(day['count'] for day in days.values()),
+                weeks=month_grid(start, days))
+
+
+def calendar_counts(start, end):
+    return calendar_counts_data(db.session.execute(calendar_counts_statement(start, end)), start)
+
+
+def venue_calendar_statement(venue_id, start, end):
+    # the venue and its shows starting in [start, end), with their artists;
+    # one row with NULL shows when there are none, no rows when there is no venue
+    return select(
+        Venue.id.label('venue_id'),
+        Venue.name.label('venue_name'),
+        Show.id,
+        Show.start_time,
+        Show.end_time,
+        Artist.id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).select_from(Venue) \
+        .outerjoin(Show, and_(Show.venue_id == Venue.id, Show.start_time >= start, Show.start_time < end)) \
+        .outerjoin(Artist, Artist.id == Show.artist_id) \
+        .where(Venue.id == venue_id).order_by(Show.start_time, Show.id)
+
+
+def venue_calendar_data(rows, start):
+    if not rows:
+        return None
+    days = {}
+    for row in rows:
+        if row.id is None:
+            continue
+        day = days.setdefault(row.start_time.date().isoformat(), {'count': 0, 'shows': []})
+        day['count'] += 1
+        day['shows'].append({
+            'artist_id': row.artist_id,
+            'artist_name': row.artist_name,
+            'artist_image_link': row.artist_image_link,
+            'start_time': row.start_time,
+            'end_time': row.end_time
+        })
+    return dict(month_links(start), id=rows[0].venue_id, name=rows[0].venue_name,
+                total=sum(day['count'] for day in days.values()), weeks=month_grid(start, days))
+
+
+def venue_calendar(venue_id, start, end):
+    return venue_calendar_data(db.session.execute(venue_calendar_statement(venue_id, start, end)).all(), start)
+
+
+#  Validators
+#  ----------------------------------------------------------------
+#  A page's validator changes whenever its HTML can: http_cache.py
+#  hashes it into the ETag and takes its latest time as Last-Modified.
+
+def detail_validator(model, id, now=None):
+    # the entity's and its shows' last changes, the last change of the
+    # venues/artists listed next to them and how many shows have started;
+    # None when there is no such entity
+    now = now or datetime.now()
+    key, other, other_key = (Show.venue_id, Artist, Show.artist_id) if model is Venue \
+        else (Show.artist_id, Venue, Show.venue_id)
+    row = db.session.execute(
+        select(
+            model.updated_at,
+            func.max(Show.updated_at),
+            func.max(other.updated_at),
+            func.count(Show.id),
+            func.count(case((Show.start_time < now, Show.id)))
+        ).select_from(model)
+        .outerjoin(Show, key == model.id)
+        .outerjoin(other, other.id == other_key)
+        .where(model.id == id)
+        .group_by(model.id, model.updated_at)
+    ).first()
+    return tuple(row) if row else None
+
+
+def venue_validator(venue_id):
+    return detail_validator(Venue, venue_id)
+
+
+def artist_validator(artist_id):
+    return detail_validator(Artist, artist_id)
+
+
+def listing_validator(model):
+    # last change and row count, so deletions count too
+    return tuple(db.session.execute(select(func.max(model.updated_at), func.count(model.id))).one())
+
+
+def venues_validator():
+    return listing_validator(Venue)
+
+
+def artists_validator():
+    return listing_validator(Artist)
+
+
+def shows_validator():
+    return tuple(db.session.execute(select(
+        func.max(Show.updated_at),
+        func.count(Show.id),
+        select(func.max(Venue.updated_at)).scalar_subquery(),
+        select(func.max(Artist.updated_at)).scalar_subquery()
+    )).one())
@@ -0,0 +1,155 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import itertools
+import threading
+import time
+from flask import current_app, g, request, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+# ----------------------------------------------------------------------------#
+# Read replicas.
+#
+# Each of SQLALCHEMY_REPLICA_URIS becomes a replica_<n> bind (see
+# pooling.replica_binds). Views marked
+# @read_only run their queries on one healthy replica, picked round-robin per
+# request. Everything else stays on the primary:
+#   - writes and flushes;
+#   - views without the mark, and CLI commands;
+#   - for REPLICA_STICKY_SECONDS after a client's last write, every request
+#     from that client (a cookie window), so it reads its own writes.
+# A replica that raises a connection error is ejected for
+# REPLICA_EJECT_SECONDS and then tried again.
+# ----------------------------------------------------------------------------#
+
+STICKY_COOKIE = 'fyyur_primary'
+
+
+def read_only(f):
+    # @app.route(...) / @read_only / def view(): ...
+    f.read_only = True
+    return f
+
+
+class Replica(object):
+
+    def __init__(self, key, engine, eject_seconds):
+        self.key = key
+        self.engine = engine
+        self.eject_seconds = eject_seconds
+        self.ejected_until = 0.0
+        self.failures = 0
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.ejected_until
+
+    def eject(self):
+        with self.lock:
+            self.failures += 1
+            self.ejected_until = time.monotonic() + self.eject_seconds
+
+    def info(self):
+        return {
+            'bind': self.key,
+            'url': self.engine.url.render_as_string(hide_password=True),
+            'healthy': self.healthy,
+            'ejected_for_s': round(max(0.0, self.ejected_until - time.monotonic()), 1),
+            'failures': self.failures,
+            'reads': self.reads
+        }
+
+
+class ReplicaSet(object):
+
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.turns = itertools.count()
+
+    def choose(self):
+        # the next healthy replica, None when all of them are ejected
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        replica = healthy[next(self.turns) % len(healthy)]
+        replica.reads += 1
+        return replica
+
+    def info(self):
+        return [replica.info() for replica in self.replicas]
+
+
+class RoutingSession(Session):
+    # sends the statements of a read-only request to its replica
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False):
+            replica = g.get('db_replica') if has_app_context() else None
+            if replica is not None:
+                return replica.engine
+        return super(RoutingSession, self).get_bind(mapper, clause, bind, **kwargs)
+
+
+def wrote(*args):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def executed(orm_execute_state):
+    # bulk DML (Query.delete(), Core inserts) never flushes
+    if not orm_execute_state.is_select:
+        wrote()
+
+
+# RoutingSession listeners marking the request as a writer, registered once
+LISTENERS = (('after_flush', wrote), ('do_orm_execute', executed))
+
+
+def init_app(app):
+    # call after db.init_app(app), which builds the replica engines
+    db = app.extensions['sqlalchemy']
+    eject_seconds = app.config.get('REPLICA_EJECT_SECONDS', 30)
+    sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+    with app.app_context():
+        replicas = ReplicaSet([
+            Replica(key, engine, eject_seconds)
+            for key, engine in sorted(db.engines.items(), key=lambda item: str(item[0]))
+            if key and key.startswith('replica_')
+        ])
+    app.extensions['replicas'] = replicas
+
+    for replica in replicas.replicas:
+        def handle_error(context, replica=replica):
+            # lost or refused connections, not errors in the statement
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+                app.logger.warning('ejecting %s for %ds: %s', replica.key, eject_seconds,
+                                   context.original_exception)
+                replica.eject()
+        event.listen(replica.engine, 'handle_error', handle_error)
+    for identifier, listener in LISTENERS:
+        if not event.contains(RoutingSession, identifier, listener):
+            event.listen(RoutingSession, identifier, listener)
+
+    @app.before_request
+    def route_request():
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, 'read_only', False) and not request.cookies.get(STICKY_COOKIE):
+            g.db_replica = replicas.choose()
+
+    @app.after_request
+    def stick_to_primary(response):
+        if g.pop('db_wrote', False) and sticky_seconds:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    return replicas
+
+
+def info():
+    replicas = current_app.extensions.get('replicas')
+    return replicas.info() if replicas else []
@@ -0,0 +1,220 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import threading
+from collections import defaultdict
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from models import db, Venue, Artist
+from queries import with_genre
+
+# ----------------------------------------------------------------------------#
+# Search backends.
+#
+# Both backends answer search(model, term, page, per_page, genre) with
+# {"count": total matches, "data": [{id, name, num_upcoming_shows}, ...]},
+# ranked by relevance and optionally limited to one genre. The PostgreSQL
+# backend relies on the pg_trgm GIN indexes created in migration
+# 3c5d8e1f7a20; the in-memory backend keeps its own trigram index for SQLite
+# and test runs.
+# ----------------------------------------------------------------------------#
+
+SEARCHABLE = (Venue, Artist)
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def trigrams(text):
+    text = '  ' + text.lower() + ' '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def result_rows(model, ids):
+    rows = db.session.query(
+        model.id,
+        model.name,
+        model.upcoming_count.label('num_upcoming_shows')
+    ).filter(model.id.in_(ids))
+    return {row.id: row for row in rows}
+
+
+class PostgresSearch(object):
+    # ILIKE is answered from the trigram GIN index; similarity() ranks the
+    # matches and count(*) OVER () returns the total with the page.
+
+    def search(self, model, term, page=1, per_page=20, genre=None):
+        rows = db.session.query(
+            model.id,
+            model.name,
+            model.upcoming_count.label('num_upcoming_shows'),
+            func.count().over().label('total')
+        )
+        rows = with_genre(rows, model, genre) \
+            .filter(model.name.ilike('%' + escape_like(term) + '%', escape='\\')) \
+            .order_by(func.similarity(model.name, term).desc(), model.name) \
+            .limit(per_page).offset((page - 1) * per_page).all()
+
+        return {
+            "count": rows[0].total if rows else 0,
+            "data": [
+                {"id": row.id, "name": row.name, "num_upcoming_shows": row.num_upcoming_shows}
+                for row in rows
+            ]
+        }
+
+
+class TrigramIndex(object):
+    # maps each lower-cased trigram to the ids of the names containing it
+
+    def __init__(self):
+        self.names = {}
+        self.postings = defaultdict(set)
+
+    def add(self, id, name):
+        self.remove(id)
+        name = (name or '').lower()
+        self.names[id] = name
+        for trigram in trigrams(name):
+            self.postings[trigram].add(id)
+
+    def remove(self, id):
+        name = self.names.pop(id, None)
+        if name is None:
+            return
+        for trigram in trigrams(name):
+            self.postings[trigram].discard(id)
+
+    def search(self, term):
+        # ids whose name contains term, best matches first
+        term = term.lower()
+        inner = term and {term[i:i + 3] for i in range(len(term) - 2)}
+        if inner:
+            candidates = set.intersection(*(self.postings.get(t, set()) for t in inner))
+        else:
+            candidates = self.names.keys()
+        matches = []
+        for id in candidates:
+            name = self.names[id]
+            position = name.find(term)
+            if position != -1:
+                matches.append((position, len(name), name, id))
+        matches.sort()
+        return [match[-1] for match in matches]
+
+
+class MemorySearch(object):
+    # pure-Python fallback: trigram indexes built on first use and kept up to
+    # date from committed sessions.
+
+    def __init__(self):
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def index(self, model):
+        with self.lock:
+            if model not in self.indexes:
+                index = TrigramIndex()
+                for id, name in db.session.query(model.id, model.name):
+                    index.add(id, name)
+                self.indexes[model] = index
+            return self.indexes[model]
+
+    def rebuild(self):
+        # drop the indexes after writes that bypass the session (bulk loads)
+        with self.lock:
+            self.indexes.clear()
+
+    def track(self, session, flush_context):
+        pending = session.info.setdefault('search_pending', [])
+        for obj in list(session.new) + list(session.dirty):
+            if type(obj) in SEARCHABLE:
+                pending.append((type(obj), obj.id, obj.name))
+        for obj in session.deleted:
+            if type(obj) in SEARCHABLE:
+                pending.append((type(obj), obj.id, None))
+
+    def apply(self, session):
+        pending = session.info.pop('search_pending', [])
+        with self.lock:
+            for model, id, name in pending:
+                index = self.indexes.get(model)
+                if index is None:
+                    continue
+                if name is None:
+                    index.remove(id)
+                else:
+                    index.add(id, name)
+
+    def discard(self, session):
+        session.info.pop('search_pending', None)
+
+    def search(self, model, term, page=1, per_page=20, genre=None):
+        index = self.index(model)
+        with self.lock:
+            # apply() changes the postings from other threads
+            ids = index.search(term)
+        if genre and ids:
+            tagged = {id for id, in with_genre(db.session.query(model.id), model, genre)}
+            ids = [id for id in ids if id in tagged]
+        page_ids = ids[(page - 1) * per_page:page * per_page]
+        rows = result_rows(model, page_ids) if page_ids else {}
+
+        data = []
+        for id in page_ids:
+            row = rows.get(id)
+            if row is None:
+                # removed behind the session's back (bulk delete)
+                with self.lock:
+                    index.remove(id)
+                continue
+            data.append({"id": row.id, "name": row.name, "num_upcoming_shows": row.num_upcoming_shows})
+        return {"count": len(ids) - (len(page_ids) - len(data)), "data": data}
+
+
+def memory_backend():
+    backend = current_app.extensions.get('search') if has_app_context() else None
+    return backend if isinstance(backend, MemorySearch) else None
+
+
+# Session listeners, registered once and handing the events to the app's
+# MemorySearch
+def track(session, flush_context):
+    backend = memory_backend()
+    if backend is not None:
+        backend.track(session, flush_context)
+
+
+def apply(session):
+    backend = memory_backend()
+    if backend is not None:
+        backend.apply(session)
+
+
+def discard(session):
+    backend = memory_backend()
+    if backend is not None:
+        backend.discard(session)
+
+
+LISTENERS = (('after_flush', track), ('after_commit', apply), ('after_rollback', discard))
+
+
+def init_app(app):
+    # SEARCH_BACKEND picks 'postgresql' or 'memory'; by default it follows the database
+    name = app.config.get('SEARCH_BACKEND')
+    if not name:
+        name = 'postgresql' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'memory'
+    app.extensions['search'] = PostgresSearch() if name == 'postgresql' else MemorySearch()
+    for identifier, listener in LISTENERS:
+        if not event.contains(Session, identifier, listener):
+            event.listen(Session, identifier, listener)
+    return app.extensions['search']
+
+
+def search(model, term, page=1, genre=None):
+    per_page = current_app.config.get('SEARCH_RESULTS_PER_PAGE', 20)
+    return current_app.extensions['search'].search(model, term, max(1, page), per_page, genre)
@@ -0,0 +1,129 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import os
+import time
+from datetime import datetime
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache
+from forms import VenueForm, ArtistForm, ShowForm
+import cache
+import queries
+
+# ----------------------------------------------------------------------------#
+# Template warmup.
+#
+# Jinja compiles a template the first time a worker renders it. With
+# TEMPLATE_CACHE_DIR set, the compiled bytecode is kept on disk and shared:
+# `flask warmup` fills it at build time and every worker then loads the
+# bytecode instead of parsing the source again. A template that changes gets
+# a new entry, since the key covers the source. warm() also renders every page
+# once against the fixtures below, so the first real request does not pay for
+# url_for, the forms or the filters either (gunicorn.conf.py runs it before
+# the workers are forked when WARMUP_ON_START is set, asgi.py at lifespan
+# startup).
+# ----------------------------------------------------------------------------#
+
+
+def show(prefix):
+    return {prefix + '_id': 0, prefix + '_name': 'Warmup', prefix + '_image_link': '',
+            'start_time': '2026-01-01 20:00:00', 'start_time_text': 'Thursday January, 1, 2026 at 8:00PM'}
+
+
+def detail(prefix, **fields):
+    data = {
+        'id': 0, 'name': 'Warmup', 'genres': ['Jazz'], 'city': 'San Francisco', 'state': 'CA',
+        'phone': '123-123-1234', 'website': 'https://example.com', 'facebook_link': '',
+        'seeking_description': 'Warmup', 'image_link': '',
+        'past_shows': [show(prefix)], 'upcoming_shows': [show(prefix)],
+        'past_shows_count': 1, 'upcoming_shows_count': 1,
+        'past_page': 1, 'past_pages': 1, 'upcoming_page': 1, 'upcoming_pages': 1
+    }
+    data.update(fields)
+    return data
+
+
+def month(**fields):
+    start = datetime(2026, 1, 1)
+    day = {'count': 1, 'shows': [dict(show('artist'), start_time=start.replace(hour=20),
+                                      end_time=start.replace(hour=22))]}
+    return dict(queries.month_links(start), total=1, weeks=queries.month_grid(start, {'2026-01-01': day}), **fields)
+
+
+def results():
+    return {'count': 1, 'data': [{'id': 0, 'name': 'Warmup'}]}
+
+
+# template: (the path it is rendered under, its context)
+FIXTURES = {
+    'pages/home.html': ('/', lambda: {}),
+    'pages/venues.html': ('/venues', lambda: {'genre': '', 'areas': [
+        {'city': 'San Francisco', 'state': 'CA', 'venues': [{'id': 0, 'name': 'Warmup'}]}
+    ]}),
+    'pages/artists.html': ('/artists', lambda: {
+        'genre': '', 'letter': '', 'after': None, 'next_cursor': 'Warmup_0',
+        'artists': [{'id': 0, 'name': 'Warmup', 'letter': 'W'}], 'letters': [{'letter': 'W', 'count': 1}]
+    }),
+    'pages/show_venue.html': ('/venues/0', lambda: {
+        'venue': detail('artist', address='1015 Folsom Street', seeking_talent=True)
+    }),
+    'pages/show_artist.html': ('/artists/0', lambda: {'artist': detail('venue', seeking_venue=True)}),
+    'pages/search_venues.html': ('/venues/search', lambda: {
+        'results': results(), 'search_term': 'warmup', 'genre': '', 'page': 1
+    }),
+    'pages/search_artists.html': ('/artists/search', lambda: {
+        'results': results(), 'search_term': 'warmup', 'genre': '', 'page': 1
+    }),
+    'pages/calendar.html': ('/shows/calendar', lambda: {'month': month()}),
+    'pages/venue_calendar.html': ('/venues/0/calendar', lambda: {'month': month(id=0, name='Warmup')}),
+    'pages/shows.html': ('/shows', lambda: {
+        'shows': [dict(show('venue'), **show('artist'))], 'next_cursor': None,
+        'after': None, 'start': None, 'end': None
+    }),
+    'forms/new_venue.html': ('/venues/create', lambda: {'form': VenueForm()}),
+    'forms/new_artist.html': ('/artists/create', lambda: {'form': ArtistForm()}),
+    'forms/new_show.html': ('/shows/create', lambda: {'form': ShowForm()}),
+    'forms/edit_venue.html': ('/venues/0/edit', lambda: {'form': VenueForm(), 'venue': {'id': 0, 'name': 'Warmup'}}),
+    'forms/edit_artist.html': ('/artists/0/edit', lambda: {'form': ArtistForm(), 'artist': {'id': 0, 'name': 'Warmup'}}),
+    'errors/404.html': ('/', lambda: {}),
+    'errors/500.html': ('/', lambda: {}),
+}
+
+
+def init_app(app):
+    directory = app.config.get('TEMPLATE_CACHE_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def compile_all(app):
+    # loads every template, writing its bytecode to the cache; returns the names
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+def render_all(app):
+    # renders each page once; returns the names
+    real = app.extensions['cache']
+    # fixture fragments must not end up in the fragment cache
+    app.extensions['cache'] = cache.NullCache()
+    try:
+        for name, (path, context) in FIXTURES.items():
+            with app.test_request_context(path):
+                render_template(name, **context())
+    finally:
+        app.extensions['cache'] = real
+    return list(FIXTURES)
+
+
+def warm(app, render=True):
+    started = time.perf_counter()
+    compiled = compile_all(app)
+    rendered = render_all(app) if render else []
+    seconds = time.perf_counter() - started
+    app.logger.info('warmed up %d templates (%d rendered) in %.3fs', len(compiled), len(rendered), seconds)
+    return {'compiled': len(compiled), 'rendered': len(rendered), 'seconds': round(seconds, 3)}
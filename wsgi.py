@@ -0,0 +1,15 @@
+# ----------------------------------------------------------------------------#
+# Production entry point.
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Runs with ProductionConfig unless FYYUR_ENV says otherwise.
+# ----------------------------------------------------------------------------#
+
+import os
+
+os.environ.setdefault('FYYUR_ENV', 'production')
+
+from app import app  # noqa: E402
+
+application = app